@@ -1,24 +1,34 @@
+import asyncio
 import base64
+import functools
+import hashlib
+import io
 import json
 import logging
 import mimetypes
 import os
-import re
-import time
-import urllib.request
-from typing import Any, Dict, Optional, Tuple
+import random
+import string
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
 
-from openai import OpenAI, OpenAIError
-from packaging import version
-
-from config_manager import ConfigManager
+from config_manager import ConfigManager, _as_bool
 from markdown_renderer import create_markdown_renderer
+from response_cache import ResponseCache
 
-# 定义默认的LLM Prompt模板。使用`.format()`方法进行后续的动态填充。
-DEFAULT_LLM_PROMPT_TEMPLATE = """# ESSAY TOPIC
-{topic}
+if TYPE_CHECKING:  # openai 导入耗时约半秒，运行时在首次使用时才加载
+    from openai import AsyncOpenAI
+
+try:  # 可选依赖：pybase64 使用SIMD实现，编码大图明显更快
+    from pybase64 import b64encode as _b64encode
+except ImportError:  # pragma: no cover - 未安装时回退到标准库
+    _b64encode = base64.b64encode
 
-# INSTRUCTIONS FOR AI (Process in English)
+
+# LLM系统提示词：评分规则与输出格式，不含任何逐次变化的数据。
+# 保持逐字节稳定，服务端才能命中前缀缓存（prompt caching）。
+LLM_SYSTEM_PROMPT = """# INSTRUCTIONS FOR AI (Process in English)
 ## 1. ROLE & GOAL
 You are a highly experienced senior high school English teacher specializing in the Chinese National College Entrance Examination (Gaokao). Your goal is to provide a detailed, constructive, and encouraging evaluation of a student's essay, correctly identifying the essay type and applying the appropriate scoring standard.
 
@@ -88,7 +98,14 @@ Analyze the text, identify the essay type, calculate the scores, and present you
 *   ---
 *   **最终得分 (Final Score):** **[总分] / 15**
 
-# INPUT DATA FOR THIS TASK
+"""
+
+_LLM_TOPIC_SECTION = """# ESSAY TOPIC
+{topic}
+
+"""
+
+_LLM_INPUT_SECTION = """# INPUT DATA FOR THIS TASK
 
 <wscore>{wscore}</wscore>
 <text>
@@ -96,6 +113,268 @@ Analyze the text, identify the essay type, calculate the scores, and present you
 </text>
 """
 
+# LLM用户消息模板：仅包含每次调用变化的数据，置于消息末尾。
+LLM_USER_TEMPLATE = _LLM_TOPIC_SECTION + _LLM_INPUT_SECTION
+
+# 定义默认的LLM Prompt模板（供界面展示与自定义）。使用`.format()`方法进行后续的动态填充。
+DEFAULT_LLM_PROMPT_TEMPLATE = _LLM_TOPIC_SECTION + LLM_SYSTEM_PROMPT + _LLM_INPUT_SECTION
+
+# VLM系统提示词：OCR与书写评分指令，同样保持逐字节稳定。
+VLM_SYSTEM_PROMPT = """# ROLE
+You are a high-precision OCR (Optical Character Recognition) and handwriting analysis engine. Your only job is to analyze the provided image and output structured data. Do not add any conversational text or explanations.
+# TASK
+Analyze the handwriting quality and extract all text from the image.
+## 1. Handwriting Quality Analysis:
+- Critically evaluate the handwriting on a continuous scale from 0.0 to 1.0.
+- The scoring must be stringent. A score of 1.0 is reserved for flawless, machine-printed-like perfection, which is virtually unattainable.
+- **Score Tiers:**
+    - **0.90-0.99:** Near-perfect, professional calligrapher level. Extremely rare.
+    - **0.80-0.89:** Excellent, clear, consistent, and aesthetically pleasing. The best a top student can achieve.
+    - **0.70-0.79:** Good and very legible, but with minor inconsistencies in size or spacing.
+    - **0.60-0.69:** Clear and legible, but with noticeable inconsistencies.
+    - **Below 0.60:** Legibility is impacted.
+- Output this score enclosed in a single <wscore> XML tag.
+## 2. Full Text Extraction:
+- Perform a high-accuracy OCR on the entire image.
+- Preserve the original line breaks and paragraph structure as best as possible.
+- Output the full extracted text enclosed in a single <text> XML tag.
+# OUTPUT FORMAT
+Strictly adhere to the following format. Do not output anything else.
+<wscore>[Your calculated score, e.g., 0.85]</wscore>
+<text>
+[The full extracted text from the image goes here.]
+</text>"""
+
+# 融合模式系统提示词：由多模态模型在一次调用中完成识别、书写评分与批改。
+# 前段说明如何从图片得到 <wscore>/<text>，后段直接复用LLM评分规则，保持逐字节稳定。
+FUSED_SYSTEM_PROMPT = """# PRELIMINARY STEP FOR AI: READ THE IMAGE YOURSELF
+You will receive the essay as a photo of the student's handwriting instead of pre-extracted text.
+Before grading, silently perform the following analysis and use its results as the `<wscore>` and `<text>` input data referred to below:
+- Handwriting quality: rate it on a continuous scale from 0.0 to 1.0 using stringent tiers (0.90-0.99 near-perfect calligraphy, extremely rare; 0.80-0.89 excellent and consistent; 0.70-0.79 good but with minor inconsistencies; 0.60-0.69 legible with noticeable inconsistencies; below 0.60 legibility is impacted). Then raise the score to the power of the sensitivity factor given in the task data; the result is `<wscore>`.
+- Full text: perform high-accuracy OCR on the entire image, preserving the original line breaks and paragraph structure; the result is `<text>`.
+Do not output these intermediate results separately; output only the final report.
+
+""" + LLM_SYSTEM_PROMPT
+
+# 融合模式用户消息模板：仅包含每次调用变化的数据，图片随后附上。
+FUSED_USER_TEMPLATE = _LLM_TOPIC_SECTION + """# INPUT DATA FOR THIS TASK
+
+Sensitivity factor: {sensitivity_factor}
+The handwritten essay is in the attached image.
+"""
+
+def _prompt_fingerprint(prompt: str) -> str:
+    """固定提示词的短指纹，用于在日志中发现前缀漂移导致的缓存失效。"""
+    return hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).hexdigest()
+
+
+# 固定系统提示词的指纹在导入时计算一次；指纹变化即意味着服务端前缀缓存会失效
+LLM_PROMPT_HASH = _prompt_fingerprint(LLM_SYSTEM_PROMPT)
+VLM_PROMPT_HASH = _prompt_fingerprint(VLM_SYSTEM_PROMPT)
+FUSED_PROMPT_HASH = _prompt_fingerprint(FUSED_SYSTEM_PROMPT)
+
+RESPONSE_CACHE_DIR_NAME = ".essay_cache"
+# VLM识别结果与LLM批改结果缓存位于响应缓存目录下的子目录，修改LLM Prompt模板清空响应缓存时不受影响
+VLM_CACHE_DIR_NAME = "vlm"
+LLM_CACHE_DIR_NAME = "llm"
+
+# 指数退避的单次等待上限（秒），Retry-After 同样受此限制
+_MAX_RETRY_DELAY = 30.0
+
+# 常见图片扩展名直接映射MIME类型，省去 mimetypes 的查表与平台注册表差异
+_IMAGE_MIME_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".gif": "image/gif",
+    ".bmp": "image/bmp",
+}
+
+# 流式token转发到UI队列的最小间隔（秒），期间到达的增量合并为一条消息
+_TOKEN_EMIT_INTERVAL = 0.05
+# 流式生成中的累计文本回调（on_text）的最小间隔（秒）
+_TEXT_CALLBACK_INTERVAL = 0.3
+
+# 分块编码时每块读取的字节数，须为3的倍数以保证各块编码结果可直接拼接
+_B64_CHUNK_SIZE = 3 * 64 * 1024
+
+
+def _probe_image(image_path: str) -> Tuple[str, int]:
+    """
+    一次性探测图片的MIME类型与文件大小，返回 (mime_type, size)。
+    文件不存在或不是可识别的图片类型时抛出异常。
+    """
+    try:
+        size = os.stat(image_path).st_size
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Image file not found at: {image_path}") from None
+    mime_type = _IMAGE_MIME_TYPES.get(os.path.splitext(image_path)[1].lower())
+    if mime_type is None:
+        mime_type, _ = mimetypes.guess_type(image_path)
+        if not mime_type or not mime_type.startswith('image'):
+            raise ValueError(f"File is not a recognizable image type: {mime_type}")
+    return mime_type, size
+
+
+def _encode_bytes_to_data_url(data: bytes, mime_type: str) -> str:
+    """将内存中的图片字节编码为数据URL：全程保持bytes，最后只做一次ASCII解码。"""
+    return (f"data:{mime_type};base64,".encode("ascii") + _b64encode(data)).decode("ascii")
+
+
+def _encode_file_to_data_url(image_path: str, mime_type: str, size: int) -> str:
+    """
+    分块读取文件并Base64编码，直接写入按最终长度预分配的缓冲区，
+    避免同时持有完整原始字节、编码字节与字符串三份副本。
+    """
+    header = f"data:{mime_type};base64,".encode("ascii")
+    buffer = bytearray(len(header) + 4 * ((size + 2) // 3))
+    buffer[: len(header)] = header
+    position = len(header)
+    remaining = size
+    with open(image_path, "rb") as image_file, memoryview(buffer) as view:
+        while remaining > 0:
+            chunk = image_file.read(min(_B64_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            encoded = _b64encode(chunk)
+            view[position : position + len(encoded)] = encoded
+            position += len(encoded)
+            remaining -= len(chunk)
+    if position != len(buffer):
+        # 文件在读取期间被截断
+        del buffer[position:]
+    return buffer.decode("ascii")
+
+
+@functools.lru_cache(maxsize=1)
+def _load_pillow() -> Optional[Tuple[Any, Any]]:
+    """按需导入可选依赖Pillow（用于上传前缩小大图），未安装时返回None。"""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:  # pragma: no cover
+        return None
+    return Image, ImageOps
+
+
+def _preload_openai() -> None:
+    """在后台线程中预先导入openai，使启动不被阻塞、首个请求也无需等待导入。"""
+    try:
+        import openai  # noqa: F401  pylint: disable=import-outside-toplevel,unused-import
+    except ImportError:  # pragma: no cover
+        pass
+
+
+def _is_retryable_error(exc: Exception) -> bool:
+    """连接错误、超时、限流与5xx可重试；鉴权、参数等客户端错误重试也无济于事。"""
+    from openai import (  # pylint: disable=import-outside-toplevel
+        APIConnectionError,
+        APIStatusError,
+        InternalServerError,
+        OpenAIError,
+        RateLimitError,
+    )
+
+    if isinstance(exc, (APIConnectionError, RateLimitError, InternalServerError)):
+        return True
+    if isinstance(exc, APIStatusError):
+        return exc.status_code in (408, 409)
+    # 其余SDK错误（如响应解析失败）不重试；流读取中断等非SDK异常沿用原有重试行为
+    return not isinstance(exc, OpenAIError)
+
+
+def _retry_after_seconds(exc: Exception) -> Optional[float]:
+    """读取服务端返回的 Retry-After 头（仅支持秒数形式）。"""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
+
+
+def _backoff_delay(attempt: int, base_delay: float, exc: Exception) -> float:
+    """计算第 attempt 次失败后的等待时间：优先遵循 Retry-After，否则指数退避加随机抖动。"""
+    retry_after = _retry_after_seconds(exc)
+    if retry_after is not None:
+        return min(retry_after, _MAX_RETRY_DELAY)
+    ceiling = min(max(base_delay, 0.0) * (2 ** attempt), _MAX_RETRY_DELAY)
+    # 等量抖动：保留一半基础等待，另一半随机，避免并发任务同时重试
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class _RequestRateLimiter:
+    """
+    简单的请求速率限制器（匀速发放令牌），用于遵守服务端的每分钟请求数（RPM）限制。
+    仅在后台事件循环中使用，无需加锁。
+    """
+
+    def __init__(self, requests_per_minute: float):
+        self.requests_per_minute = requests_per_minute
+        self._interval = 60.0 / requests_per_minute
+        self._next_slot = 0.0
+
+    async def acquire(self):
+        now = asyncio.get_running_loop().time()
+        wait = self._next_slot - now
+        self._next_slot = max(self._next_slot, now) + self._interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def _extract_tag(buffer: str, tag: str) -> Optional[str]:
+    """提取第一个 <tag>...</tag> 之间的内容；VLM输出格式固定，用 str.find 单次扫描即可。"""
+    open_tag = f"<{tag}>"
+    start = buffer.find(open_tag)
+    if start == -1:
+        return None
+    start += len(open_tag)
+    end = buffer.find(f"</{tag}>", start)
+    if end == -1:
+        return None
+    return buffer[start:end]
+
+
+@functools.lru_cache(maxsize=16)
+def _compile_prompt_template(template: str) -> Optional[Tuple[Tuple[str, Optional[str]], ...]]:
+    """
+    将模板预解析为 (字面文本, 字段名) 片段序列，渲染时只需拼接字符串。
+    含格式说明、转换符或属性/下标访问的字段无法直接拼接，返回None交由 `.format` 处理。
+    """
+    parts: List[Tuple[str, Optional[str]]] = []
+    try:
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(template):
+            if field_name is not None and (
+                format_spec or conversion or not field_name.isidentifier()
+            ):
+                return None
+            parts.append((literal, field_name))
+    except ValueError:
+        return None
+    return tuple(parts)
+
+
+def _render_prompt_template(template: str, **values: Any) -> str:
+    """按预解析结果填充模板，语义与 `template.format(**values)` 一致。"""
+    parts = _compile_prompt_template(template)
+    if parts is None:
+        return template.format(**values)
+    pieces: List[str] = []
+    for literal, field_name in parts:
+        pieces.append(literal)
+        if field_name is not None:
+            pieces.append(str(values[field_name]))
+    return "".join(pieces)
+
+
+def _zero_usage() -> Dict[str, int]:
+    return {"prompt_tokens": 0, "completion_tokens": 0}
+
+
 class ApiService:
     """封装了与外部API（VLM和LLM）交互的所有逻辑。"""
     def __init__(self, config_manager: ConfigManager, ui_queue: Optional[Any] = None):
@@ -103,6 +382,22 @@ class ApiService:
         self.ui_queue = ui_queue
         self.markdown_renderer = create_markdown_renderer(config_manager)
         self.logger = logging.getLogger("essay_corrector.api")
+        config_dir = os.path.dirname(os.path.abspath(config_manager.file_path))
+        self.response_cache = ResponseCache(os.path.join(config_dir, RESPONSE_CACHE_DIR_NAME))
+        self.vlm_cache = ResponseCache(
+            os.path.join(config_dir, RESPONSE_CACHE_DIR_NAME, VLM_CACHE_DIR_NAME)
+        )
+        self.llm_cache = ResponseCache(
+            os.path.join(config_dir, RESPONSE_CACHE_DIR_NAME, LLM_CACHE_DIR_NAME)
+        )
+        threading.Thread(target=_preload_openai, name="essay-corrector-preload", daemon=True).start()
+        self._clients: Dict[Tuple[str, str, float], "AsyncOpenAI"] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+        self._rate_limiter: Optional[_RequestRateLimiter] = None
+        # 报告渲染与写盘使用独立的小线程池，不占用事件循环
+        self._io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="essay-corrector-io")
+        self._logged_prompt_fingerprints: set = set()
 
     def _log(self, message: str):
         """将日志消息放入UI队列。"""
@@ -110,16 +405,77 @@ class ApiService:
         if self.ui_queue:
             self.ui_queue.put(("log", message))
 
-    def _encode_image_to_base64_url(self, image_path: str) -> str:
-        """将本地图片文件编码为Base64数据URL。"""
-        if not os.path.exists(image_path):
-            raise FileNotFoundError(f"Image file not found at: {image_path}")
-        mime_type, _ = mimetypes.guess_type(image_path)
-        if not mime_type or not mime_type.startswith('image'):
-            raise ValueError(f"File is not a recognizable image type: {mime_type}")
-        with open(image_path, "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-        return f"data:{mime_type};base64,{encoded_string}"
+    def _emit(self, task: str, data: Any):
+        """将非日志类事件（如流式token）放入UI队列。"""
+        if self.ui_queue:
+            self.ui_queue.put((task, data))
+
+    def _system_message(self, content: str) -> Dict[str, Any]:
+        """
+        构建系统消息。开启 PromptCacheControl 时附加 Anthropic 风格的
+        cache_control 标记，其余服务依赖自动前缀缓存即可。
+        """
+        if _as_bool(self.config.get("PromptCacheControl", False)):
+            return {
+                "role": "system",
+                "content": [
+                    {"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}
+                ],
+            }
+        return {"role": "system", "content": content}
+
+    def _downscale_image(self, image_path: str) -> Optional[bytes]:
+        """
+        长边超过 ImageMaxSide 时缩小并重新编码为JPEG，返回新的图片字节；
+        无需缩小、未安装Pillow或处理失败时返回None，由调用方发送原图。
+        """
+        pillow = _load_pillow()
+        if pillow is None:
+            return None
+        Image, ImageOps = pillow  # pylint: disable=invalid-name
+        try:
+            max_side = int(self.config.get("ImageMaxSide", 2048))
+        except (ValueError, TypeError):
+            max_side = 2048
+        if max_side <= 0:
+            return None
+        try:
+            quality = int(self.config.get("ImageJpegQuality", 85))
+        except (ValueError, TypeError):
+            quality = 85
+        quality = min(max(quality, 1), 95)
+        try:
+            with Image.open(image_path) as image:
+                if max(image.size) <= max_side:
+                    return None
+                # 手机照片的方向记录在EXIF中，重新编码会丢失，需先转正
+                image = ImageOps.exif_transpose(image)
+                if image.mode != "RGB":
+                    image = image.convert("RGB")
+                image.thumbnail((max_side, max_side), Image.LANCZOS)
+                buffer = io.BytesIO()
+                image.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+                return buffer.getvalue()
+        except Exception as exc:  # pylint: disable=broad-except
+            self._log(f"图片缩放失败，改为发送原图：{exc}")
+            return None
+
+    def _encode_image_sync(self, image_path: str, image_info: Optional[Tuple[str, int]] = None) -> str:
+        """
+        将本地图片文件编码为Base64数据URL（阻塞实现，供线程池调用）。
+        image_info 为预先探测的 (mime_type, size)，批量处理时可省去重复探测。
+        """
+        mime_type, size = image_info or _probe_image(image_path)
+        resized = self._downscale_image(image_path)
+        if resized is not None:
+            return _encode_bytes_to_data_url(resized, "image/jpeg")
+        return _encode_file_to_data_url(image_path, mime_type, size)
+
+    async def _encode_image_to_base64_url(
+        self, image_path: str, image_info: Optional[Tuple[str, int]] = None
+    ) -> str:
+        """在工作线程中读取并编码图片，避免阻塞事件循环。"""
+        return await asyncio.to_thread(self._encode_image_sync, image_path, image_info)
 
     def _chat_endpoint(self, base_url: Optional[str]) -> str:
         if not base_url:
@@ -133,7 +489,7 @@ class ApiService:
             "completion_tokens": int(usage.get("completion_tokens", 0) or 0),
         }
 
-    def _create_openai_client(self, base_url: str, api_key: Optional[str], timeout: float) -> OpenAI:
+    def _create_openai_client(self, base_url: str, api_key: Optional[str], timeout: float) -> "AsyncOpenAI":
         client_kwargs: Dict[str, Any] = {
             "base_url": base_url.rstrip("/"),
             "timeout": max(timeout, 1.0),
@@ -141,53 +497,433 @@ class ApiService:
         }
         if api_key:
             client_kwargs["api_key"] = api_key
-        return OpenAI(**client_kwargs)
+        from openai import AsyncOpenAI  # pylint: disable=import-outside-toplevel
+
+        return AsyncOpenAI(**client_kwargs)
+
+    async def _get_openai_client(self, base_url: str, api_key: Optional[str], timeout: float) -> "AsyncOpenAI":
+        """
+        按 (地址, 密钥, 超时) 复用客户端，使连接池与TLS会话在多篇作文之间保持；
+        配置变更后自然生成新的键。仅在后台事件循环线程中调用，无需加锁。
+        """
+        cache_key = (base_url.rstrip("/"), api_key or "", max(timeout, 1.0))
+        client = self._clients.get(cache_key)
+        if client is None:
+            created = await asyncio.to_thread(self._create_openai_client, base_url, api_key, timeout)
+            # 并发构建时以先写入者为准
+            client = self._clients.setdefault(cache_key, created)
+            if client is not created:
+                await created.close()
+        return client
+
+    def _log_prompt_fingerprint(self, fused: bool, prompt_template: Optional[str]):
+        """每种提示词组合只记录一次指纹，便于排查配置变更是否破坏了前缀缓存。"""
+        if fused:
+            fingerprint = f"fused={FUSED_PROMPT_HASH}"
+        elif not prompt_template or prompt_template == DEFAULT_LLM_PROMPT_TEMPLATE:
+            fingerprint = f"vlm={VLM_PROMPT_HASH}, llm={LLM_PROMPT_HASH}"
+        else:
+            fingerprint = f"vlm={VLM_PROMPT_HASH}, llm=custom:{_prompt_fingerprint(prompt_template)}"
+        if fingerprint in self._logged_prompt_fingerprints:
+            return
+        self._logged_prompt_fingerprints.add(fingerprint)
+        self._log(f"提示词前缀指纹: {fingerprint}")
+
+    async def _wait_for_rate_limit(self):
+        """按 RequestsPerMinute 配置节流，未配置或不大于0时不限制。"""
+        try:
+            requests_per_minute = float(self.config.get("RequestsPerMinute", 0) or 0)
+        except (ValueError, TypeError):
+            requests_per_minute = 0.0
+        if requests_per_minute <= 0:
+            self._rate_limiter = None
+            return
+        if self._rate_limiter is None or self._rate_limiter.requests_per_minute != requests_per_minute:
+            self._rate_limiter = _RequestRateLimiter(requests_per_minute)
+        await self._rate_limiter.acquire()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """启动（如尚未启动）常驻后台事件循环线程，所有模型调用都在其中执行。"""
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever,
+                    name="essay-corrector-api-loop",
+                    daemon=True,
+                )
+                thread.start()
+                self._loop = loop
+            return self._loop
 
-    def _invoke_chat_completion(
+    def run_async(self, coroutine: Any) -> "Future[Any]":
+        """将协程提交到常驻事件循环执行，返回可在任意线程等待的 Future。"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop())
+
+    async def _consume_stream(
         self,
         label: str,
-        base_url: Optional[str],
-        api_key: Optional[str],
+        stream: Any,
+        marker: Optional[str] = None,
+        marker_future: Optional["asyncio.Future[str]"] = None,
+        on_text: Optional[Callable[[str], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        逐块读取流式响应，将增量token按 _TOKEN_EMIT_INTERVAL 合并后转发到UI队列，
+        并拼装为与非流式响应相同结构的字典。
+        指定 `marker` 时，一旦累计文本中出现该标记即把当前文本写入 `marker_future`，
+        调用方可立即开始下一步，本方法继续读完剩余内容以获取用量统计。
+        指定 `on_text` 时，按 _TEXT_CALLBACK_INTERVAL 以目前为止的累计文本调用它（首个token立即回调）。
+        """
+        token_task = f"{label.lower()}_token"
+        parts: List[str] = []
+        usage: Dict[str, Any] = {}
+        finish_reason: Optional[str] = None
+        buffer = ""
+        loop = asyncio.get_running_loop()
+        pending: List[str] = []
+        last_emit = loop.time()
+        last_text_callback = float("-inf")
+        try:
+            async for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage.model_dump()
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                delta = choice.delta.content if choice.delta else None
+                if delta:
+                    parts.append(delta)
+                    if self.ui_queue:
+                        pending.append(delta)
+                        now = loop.time()
+                        if now - last_emit >= _TOKEN_EMIT_INTERVAL:
+                            self._emit(token_task, "".join(pending))
+                            pending.clear()
+                            last_emit = now
+                    if on_text:
+                        now = loop.time()
+                        if now - last_text_callback >= _TEXT_CALLBACK_INTERVAL:
+                            on_text("".join(parts))
+                            last_text_callback = now
+                    if marker and marker_future and not marker_future.done():
+                        search_from = max(0, len(buffer) - len(marker) + 1)
+                        buffer += delta
+                        if buffer.find(marker, search_from) != -1:
+                            marker_future.set_result(buffer)
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+        except Exception as exc:  # pylint: disable=broad-except
+            # 标记已送达时结果已被使用，剩余部分读取失败只影响用量统计，不再重试
+            if not (marker_future and marker_future.done()):
+                raise
+            self._log(f"{label} 流式响应尾部读取失败，忽略：{exc}")
+        finally:
+            if pending:
+                self._emit(token_task, "".join(pending))
+        return {
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(parts)},
+                    "finish_reason": finish_reason,
+                }
+            ],
+            "usage": usage,
+        }
+
+    async def _invoke_chat_completion(
+        self,
+        label: str,
+        client: "AsyncOpenAI",
         payload: Dict[str, Any],
         max_retries: int,
         retry_delay: int,
-        timeout: float,
+        marker: Optional[str] = None,
+        marker_future: Optional["asyncio.Future[str]"] = None,
+        on_text: Optional[Callable[[str], None]] = None,
     ) -> Dict[str, Any]:
-        normalized_base_url = self._chat_endpoint(base_url)
-        endpoint = f"{normalized_base_url}/chat/completions"
-        client = self._create_openai_client(normalized_base_url, api_key, timeout)
+        endpoint = f"{str(client.base_url).rstrip('/')}/chat/completions"
+        stream = _as_bool(self.config.get("StreamResponses", True))
+        request_payload = dict(payload)
+        if stream:
+            request_payload["stream"] = True
+            request_payload["stream_options"] = {"include_usage": True}
         last_error: Optional[Exception] = None
         for attempt in range(max_retries):
             try:
                 model = payload.get("model")
-                self._log(f"{label} 请求: endpoint={endpoint}, model={model}")
-                response = client.chat.completions.create(**payload)
-                response_json = response.model_dump()
+                await self._wait_for_rate_limit()
+                self._log(f"{label} 请求: endpoint={endpoint}, model={model}, stream={stream}")
+                response = await client.chat.completions.create(**request_payload)
+                if stream:
+                    response_json = await self._consume_stream(
+                        label, response, marker, marker_future, on_text
+                    )
+                else:
+                    response_json = response.model_dump()
                 trimmed = json.dumps(response_json, ensure_ascii=False)
                 if len(trimmed) > 800:
                     trimmed = trimmed[:797] + "..."
                 self._log(f"{label} 响应: {trimmed}")
                 return response_json
-            except OpenAIError as exc:
-                last_error = exc
-                error_message = str(exc)
             except Exception as exc:  # pylint: disable=broad-except
                 last_error = exc
                 error_message = str(exc)
-            if attempt == max_retries - 1:
+            if attempt == max_retries - 1 or not _is_retryable_error(last_error):
                 raise last_error
-            self._log(f"{label} 调用失败，{retry_delay}秒后重试... (尝试 {attempt + 1}/{max_retries})，错误: {error_message}")
-            time.sleep(retry_delay)
+            delay = _backoff_delay(attempt, retry_delay, last_error)
+            self._log(f"{label} 调用失败，{delay:.1f}秒后重试... (尝试 {attempt + 1}/{max_retries})，错误: {error_message}")
+            await asyncio.sleep(delay)
         if last_error:
             raise last_error
         raise RuntimeError(f"{label} 调用失败：未知错误")
 
-    def process_essay_image(self, file_path: str, topic: str) -> Tuple[str, Dict[str, int], Dict[str, int]]:
+    async def _run_vlm_call(
+        self,
+        client: "AsyncOpenAI",
+        payload: Dict[str, Any],
+        max_retries: int,
+        retry_delay: int,
+        text_ready: "asyncio.Future[str]",
+    ) -> Dict[str, Any]:
+        """调用VLM；流式输出出现 `</text>` 时提前通过 `text_ready` 交付文本。"""
+        return await self._invoke_chat_completion(
+            "VLM",
+            client,
+            payload,
+            max_retries,
+            retry_delay,
+            marker="</text>",
+            marker_future=text_ready,
+        )
+
+    async def _warm_llm_prefix(self, client_task: "asyncio.Task[AsyncOpenAI]", model: str) -> Dict[str, int]:
+        """
+        发送仅含固定系统提示词、max_tokens=1 的预热请求，
+        让服务端在VLM识别期间提前缓存LLM提示词前缀。失败时静默忽略。
+        """
+        try:
+            client = await client_task
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[self._system_message(LLM_SYSTEM_PROMPT), {"role": "user", "content": "."}],
+                max_tokens=1,
+                temperature=0,
+            )
+            self._log("LLM 前缀预热完成")
+            return self._usage_from_response(response.model_dump())
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:  # pylint: disable=broad-except
+            self._log(f"LLM 前缀预热失败，忽略：{exc}")
+            return _zero_usage()
+
+    def _cache_enabled(self, *temperatures: float) -> bool:
+        """缓存关闭、或任一温度大于0且未显式允许缓存非确定性结果时返回False。"""
+        if not _as_bool(self.config.get("ResponseCache", True)):
+            return False
+        if any(value > 0 for value in temperatures) and not _as_bool(
+            self.config.get("CacheNonDeterministic", False)
+        ):
+            return False
+        return True
+
+    @staticmethod
+    async def _image_digest(file_path: str) -> Optional[str]:
+        """在线程中计算图片内容摘要，读取失败时返回None（视为不缓存）。"""
+        try:
+            return await asyncio.to_thread(ResponseCache.file_digest, file_path)
+        except OSError:
+            return None
+
+    @staticmethod
+    def _vlm_cache_key(image_digest: str, vlm_model: str, vlm_temperature: float) -> str:
+        """VLM识别缓存键：图片内容、VLM系统提示词、模型与温度，与题目和LLM设置无关。"""
+        return ResponseCache.make_key(
+            image_digest, VLM_SYSTEM_PROMPT, str(vlm_model), repr(vlm_temperature)
+        )
+
+    @staticmethod
+    def _llm_cache_key(llm_payload: Dict[str, Any]) -> str:
+        """
+        LLM批改缓存键：模型、温度与渲染后的消息内容，忽略空白差异。
+        同一篇作文重新拍照后识别出相同文本时，可直接复用已有报告。
+        """
+        parts = [str(llm_payload["model"]), repr(llm_payload["temperature"])]
+        for message in llm_payload["messages"]:
+            content = message["content"]
+            if not isinstance(content, str):
+                content = json.dumps(content, ensure_ascii=False, sort_keys=True)
+            parts.append(message["role"])
+            parts.append(" ".join(content.split()))
+        return ResponseCache.make_key(*parts)
+
+    @staticmethod
+    def _response_cache_key(
+        image_digest: str,
+        topic: str,
+        prompt_template: str,
+        vlm_model: str,
+        llm_model: str,
+        vlm_temperature: float,
+        llm_temperature: float,
+        sensitivity_factor: float,
+        fused: bool = False,
+    ) -> str:
+        """计算本地响应缓存键：图片内容、题目、Prompt模板及影响输出的模型参数。"""
+        template_digest = hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()
+        # 融合模式的输出与两步流程不同，追加标记区分；两步流程的键保持不变
+        mode_parts = ("fused",) if fused else ()
+        return ResponseCache.make_key(
+            image_digest,
+            topic,
+            template_digest,
+            str(vlm_model),
+            str(llm_model),
+            repr(vlm_temperature),
+            repr(llm_temperature),
+            repr(sensitivity_factor),
+            *mode_parts,
+        )
+
+    def cache_invalidate(self) -> int:
+        """清空本地响应缓存（例如Prompt模板变更后），返回删除的条目数。"""
+        removed = self.response_cache.clear()
+        if removed:
+            self._log(f"已清空本地响应缓存：{removed} 项")
+        return removed
+
+    def _render_html_report(
+        self, final_report: str, file_path: str, render_html: Optional[bool] = None
+    ) -> Optional[str]:
+        """渲染Markdown为HTML（render_html 为 None 时由配置决定），返回HTML文件路径。"""
+        if not self.markdown_renderer:
+            return None
+        # 定义HTML报告的文件名
+        report_base_name = os.path.splitext(file_path)[0]
+        html_output_path = f"{report_base_name}_report.html"
+
+        html_path = self.markdown_renderer.render_markdown_to_html_file(
+            final_report, html_output_path, enabled=render_html
+        )
+        if html_path:
+            self._log(f"已生成HTML报告: {os.path.basename(html_path)}")
+        return html_path
+
+    async def _render_html_report_async(
+        self, final_report: str, file_path: str, render_html: Optional[bool] = None
+    ) -> Optional[str]:
+        """在IO线程池中渲染HTML报告，避免模板渲染与写盘阻塞其他并发请求。"""
+        if not self.markdown_renderer or render_html is False:
+            return None
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._io_pool, self._render_html_report, final_report, file_path, render_html
+        )
+
+    async def _run_fused_call(
+        self,
+        file_path: str,
+        topic: str,
+        llm_model: str,
+        llm_temperature: float,
+        sensitivity_factor: float,
+        request_timeout: float,
+        max_retries: int,
+        retry_delay: int,
+        image_info: Optional[Tuple[str, int]] = None,
+        on_text: Optional[Callable[[str], None]] = None,
+    ) -> Tuple[str, Dict[str, int]]:
+        """
+        融合模式：将图片直接交给多模态LLM，一次调用完成识别与批改，
+        省去VLM往返与 <wscore>/<text> 解析。使用LLM的地址、密钥与模型配置。
+        自定义Prompt模板依赖VLM提取的文本，融合模式下不生效。
+        返回: (批改报告, token使用情况)
+        """
+        llm_base_url = self._chat_endpoint(self.config.get("LlmUrl"))
+        encode_task = asyncio.create_task(self._encode_image_to_base64_url(file_path, image_info))
+        client_task = asyncio.create_task(
+            self._get_openai_client(
+                llm_base_url,
+                self.config.get("LlmApiKey"),
+                request_timeout,
+            )
+        )
+        try:
+            base64_image_url, client = await asyncio.gather(encode_task, client_task)
+        except Exception:
+            for task in (encode_task, client_task):
+                task.cancel()
+            raise
+
+        messages = [
+            self._system_message(FUSED_SYSTEM_PROMPT),
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": _render_prompt_template(
+                            FUSED_USER_TEMPLATE,
+                            topic=topic,
+                            sensitivity_factor=sensitivity_factor,
+                        ),
+                    },
+                    {"type": "image_url", "image_url": {"url": base64_image_url}},
+                ],
+            },
+        ]
+        payload = {
+            "model": llm_model,
+            "messages": messages,
+            "temperature": llm_temperature,
+            "max_tokens": 4096,
+        }
+        response_json = await self._invoke_chat_completion(
+            "LLM",
+            client,
+            payload,
+            max_retries,
+            retry_delay,
+            on_text=on_text,
+        )
+
+        choices = response_json.get("choices") or []
+        if not choices:
+            raise ValueError(f"LLM 未返回 choices，响应：{response_json}")
+        final_report = choices[0].get("message", {}).get("content")
+        if not final_report:
+            raise ValueError("LLM 未能生成报告。")
+        return final_report, self._usage_from_response(response_json)
+
+    def process_essay_image(
+        self, file_path: str, topic: str
+    ) -> Tuple[str, Dict[str, int], Dict[str, int], Optional[str]]:
+        """
+        同步入口：将 `process_essay_image_async` 提交到常驻事件循环并等待结果。
+        多个工作线程可同时调用，请求在同一事件循环中并发执行并共享连接池。
+        """
+        return self.run_async(self.process_essay_image_async(file_path, topic)).result()
+
+    async def process_essay_image_async(
+        self,
+        file_path: str,
+        topic: str,
+        image_info: Optional[Tuple[str, int]] = None,
+        render_html: Optional[bool] = None,
+        on_report_text: Optional[Callable[[str], None]] = None,
+    ) -> Tuple[str, Dict[str, int], Dict[str, int], Optional[str]]:
         """
         执行完整的两步式作文批改流程：
         1. VLM调用：分析作文图片，提取手写文本和书写质量分数。
         2. LLM调用：基于VLM的输出和作文题目，生成详细的批改报告。
-        返回: (批改报告, VLM token使用情况, LLM token使用情况)
+        图片编码与客户端构建并发进行，LLM客户端在VLM请求期间提前构建；
+        VLM流式输出一出现 `</text>` 即开始LLM调用，可选地预热LLM提示词前缀。
+        开启 FusedMode 时改为由多模态LLM单次调用完成识别与批改。
+        render_html 为 False 时不渲染HTML报告；None 表示由 RenderMarkdown 配置决定。
+        on_report_text 在流式生成批改报告期间以目前为止的报告文本被调用（仅 StreamResponses 开启时）。
+        返回: (批改报告, VLM token使用情况, LLM token使用情况, HTML报告路径)
         """
         # --- 步骤 1: 调用VLM进行图像分析 ---
         try:
@@ -208,137 +944,255 @@ class ApiService:
             vlm_temperature = 0.0
         vlm_temperature = min(max(vlm_temperature, 0.0), 2.0)
 
-        base64_image_url = self._encode_image_to_base64_url(file_path)
-
-        vlm_prompt = """# ROLE
-You are a high-precision OCR (Optical Character Recognition) and handwriting analysis engine. Your only job is to analyze the provided image and output structured data. Do not add any conversational text or explanations.
-# TASK
-Analyze the handwriting quality and extract all text from the image.
-## 1. Handwriting Quality Analysis:
-- Critically evaluate the handwriting on a continuous scale from 0.0 to 1.0.
-- The scoring must be stringent. A score of 1.0 is reserved for flawless, machine-printed-like perfection, which is virtually unattainable.
-- **Score Tiers:**
-    - **0.90-0.99:** Near-perfect, professional calligrapher level. Extremely rare.
-    - **0.80-0.89:** Excellent, clear, consistent, and aesthetically pleasing. The best a top student can achieve.
-    - **0.70-0.79:** Good and very legible, but with minor inconsistencies in size or spacing.
-    - **0.60-0.69:** Clear and legible, but with noticeable inconsistencies.
-    - **Below 0.60:** Legibility is impacted.
-- Output this score enclosed in a single <wscore> XML tag.
-## 2. Full Text Extraction:
-- Perform a high-accuracy OCR on the entire image.
-- Preserve the original line breaks and paragraph structure as best as possible.
-- Output the full extracted text enclosed in a single <text> XML tag.
-# OUTPUT FORMAT
-Strictly adhere to the following format. Do not output anything else.
-<wscore>[Your calculated score, e.g., 0.85]</wscore>
-<text>
-[The full extracted text from the image goes here.]
-</text>"""
-        vlm_messages = [{"role": "user", "content": [{"type": "text", "text": vlm_prompt}, {"type": "image_url", "image_url": {"url": base64_image_url}}]}]
-        
-        vlm_model = self.config.get("VlmModel", "Qwen/Qwen3-VL-235B-A22B-Instruct")
-        vlm_payload = {
-            "model": vlm_model,
-            "messages": vlm_messages,
-            "max_tokens": 4096,
-            "temperature": vlm_temperature,
-        }
-        vlm_response_json = self._invoke_chat_completion(
-            "VLM",
-            self.config.get("VlmUrl"),
-            self.config.get("VlmApiKey"),
-            vlm_payload,
-            max_retries,
-            retry_delay,
-            request_timeout,
-        )
-
-        choices = vlm_response_json.get("choices") or []
-        if not choices:
-            raise ValueError(f"VLM 未返回 choices，响应：{vlm_response_json}")
-        vlm_output = choices[0].get("message", {}).get("content") or ""
+        try:
+            llm_temperature = float(self.config.get("LlmTemperature", 0.0))
+        except (ValueError, TypeError):
+            llm_temperature = 0.0
+        llm_temperature = min(max(llm_temperature, 0.0), 2.0)
 
-        vlm_usage = self._usage_from_response(vlm_response_json)
-        
-        # 解析VLM返回的XML格式输出，提取分数和文本
-        wscore_match = re.search(r'<wscore>(.*?)</wscore>', vlm_output, re.DOTALL)
-        text_match = re.search(r'<text>(.*?)</text>', vlm_output, re.DOTALL)
-        original_wscore = float(wscore_match.group(1).strip()) if wscore_match else 0.0
-        essay_text = text_match.group(1).strip() if text_match else "错误：无法从图片中提取文本。"
-        
         try:
             sensitivity_factor = float(self.config.get("SensitivityFactor", "1.0"))
         except (ValueError, TypeError):
             # 如果配置的敏感度因子无效，则使用默认值1.0
-            sensitivity_factor = 1.0 
-            
-        wscore = original_wscore ** sensitivity_factor
-
-        if not text_match:
-            raise ValueError(f"VLM未能按预期格式返回，无法解析文本。模型返回：\n{vlm_output}")
+            sensitivity_factor = 1.0
 
-        # --- 步骤 2: 调用LLM生成批改报告 ---
-        # 从配置加载Prompt模板，若用户未定义则使用默认模板
         prompt_template = self.config.get("LlmPromptTemplate")
-        if not prompt_template:
-            prompt_template = DEFAULT_LLM_PROMPT_TEMPLATE
-        
-        # 使用作文题目、书写分数和识别出的文本填充Prompt模板
-        final_llm_prompt = prompt_template.format(
-            topic=topic,
-            wscore=wscore,
-            essay_text=essay_text
-        )
-        
-        llm_messages = [{"role": "user", "content": final_llm_prompt}]
+        vlm_model = self.config.get("VlmModel", "Qwen/Qwen3-VL-235B-A22B-Instruct")
+        llm_model = self.config.get("LlmModel", "Qwen/Qwen3-VL-235B-A22B-Instruct")
+        fused = _as_bool(self.config.get("FusedMode", False))
+        self._log_prompt_fingerprint(fused, prompt_template)
+
+        # 命中本地缓存时直接返回，跳过两次网络往返
+        image_digest = await self._image_digest(file_path) if self._cache_enabled(vlm_temperature) else None
+        cache_key: Optional[str] = None
+        if image_digest and self._cache_enabled(vlm_temperature, llm_temperature):
+            cache_key = self._response_cache_key(
+                image_digest,
+                topic,
+                prompt_template or DEFAULT_LLM_PROMPT_TEMPLATE,
+                vlm_model,
+                llm_model,
+                vlm_temperature,
+                llm_temperature,
+                sensitivity_factor,
+                fused,
+            )
+        if cache_key:
+            cached = self.response_cache.get(cache_key)
+            if cached:
+                self._log(f"命中本地缓存，跳过模型调用: {os.path.basename(file_path)}")
+                final_report = cached["report"]
+                html_path = await self._render_html_report_async(final_report, file_path, render_html)
+                return final_report, _zero_usage(), _zero_usage(), html_path
+
+        if fused:
+            final_report, llm_usage = await self._run_fused_call(
+                file_path,
+                topic,
+                llm_model,
+                llm_temperature,
+                sensitivity_factor,
+                request_timeout,
+                max_retries,
+                retry_delay,
+                image_info,
+                on_report_text,
+            )
+            if cache_key:
+                self.response_cache.set(
+                    cache_key,
+                    {"report": final_report, "vlm_usage": _zero_usage(), "llm_usage": llm_usage},
+                )
+            html_path = await self._render_html_report_async(final_report, file_path, render_html)
+            return final_report, _zero_usage(), llm_usage, html_path
 
+        # 识别结果只取决于图片与VLM设置：同一图片换题目或改Prompt后重新批改时跳过VLM调用
+        vlm_cache_key = self._vlm_cache_key(image_digest, vlm_model, vlm_temperature) if image_digest else None
+        cached_vlm = self.vlm_cache.get(vlm_cache_key) if vlm_cache_key else None
+        if cached_vlm:
+            self._log(f"命中VLM识别缓存，跳过VLM调用: {os.path.basename(file_path)}")
+        else:
+            vlm_base_url = self._chat_endpoint(self.config.get("VlmUrl"))
+            encode_task = asyncio.create_task(self._encode_image_to_base64_url(file_path, image_info))
+            vlm_client_task = asyncio.create_task(
+                self._get_openai_client(
+                    vlm_base_url,
+                    self.config.get("VlmApiKey"),
+                    request_timeout,
+                )
+            )
+            try:
+                base64_image_url, vlm_client = await asyncio.gather(encode_task, vlm_client_task)
+            except Exception:
+                for task in (encode_task, vlm_client_task):
+                    task.cancel()
+                raise
+
+            vlm_messages = [
+                self._system_message(VLM_SYSTEM_PROMPT),
+                {"role": "user", "content": [{"type": "image_url", "image_url": {"url": base64_image_url}}]},
+            ]
+
+            vlm_payload = {
+                "model": vlm_model,
+                "messages": vlm_messages,
+                "max_tokens": 4096,
+                "temperature": vlm_temperature,
+            }
+        # 在VLM请求进行期间提前构建LLM客户端；地址缺失时留到LLM阶段再报告错误
+        use_default_template = not prompt_template or prompt_template == DEFAULT_LLM_PROMPT_TEMPLATE
+        llm_client_task: Optional[asyncio.Task] = None
+        warmup_task: Optional[asyncio.Task] = None
+        if self.config.get("LlmUrl"):
+            llm_client_task = asyncio.create_task(
+                self._get_openai_client(
+                    self._chat_endpoint(self.config.get("LlmUrl")),
+                    self.config.get("LlmApiKey"),
+                    request_timeout,
+                )
+            )
+            # 命中识别缓存时LLM请求立即开始，预热没有可重叠的时间
+            if (
+                not cached_vlm
+                and use_default_template
+                and _as_bool(self.config.get("LlmPrefixWarmup", False))
+            ):
+                warmup_task = asyncio.create_task(self._warm_llm_prefix(llm_client_task, llm_model))
+
+        # VLM流式输出中一出现 </text> 即开始LLM调用，其余尾部内容在后台读完
+        text_ready: "asyncio.Future[str]" = asyncio.get_running_loop().create_future()
+        vlm_task: Optional[asyncio.Task] = None
+        if cached_vlm:
+            text_ready.set_result(cached_vlm["output"])
+        else:
+            vlm_task = asyncio.create_task(
+                self._run_vlm_call(vlm_client, vlm_payload, max_retries, retry_delay, text_ready)
+            )
         try:
-            llm_temperature = float(self.config.get("LlmTemperature", 0.0))
-        except (ValueError, TypeError):
-            llm_temperature = 0.0
-        llm_temperature = min(max(llm_temperature, 0.0), 2.0)
+            if vlm_task:
+                await asyncio.wait({vlm_task, text_ready}, return_when=asyncio.FIRST_COMPLETED)
+            if text_ready.done():
+                vlm_output = text_ready.result()
+            else:
+                vlm_response_json = vlm_task.result()
+                choices = vlm_response_json.get("choices") or []
+                if not choices:
+                    raise ValueError(f"VLM 未返回 choices，响应：{vlm_response_json}")
+                vlm_output = choices[0].get("message", {}).get("content") or ""
 
-        llm_model = self.config.get("LlmModel", "Qwen/Qwen3-VL-235B-A22B-Instruct")
-        llm_payload = {
-            "model": llm_model,
-            "messages": llm_messages,
-            "temperature": llm_temperature,
-            "max_tokens": 4096,
-        }
+            # 解析VLM返回的XML格式输出，提取分数和文本
+            wscore_value = _extract_tag(vlm_output, "wscore")
+            text_value = _extract_tag(vlm_output, "text")
+            original_wscore = float(wscore_value.strip()) if wscore_value is not None else 0.0
+            essay_text = text_value.strip() if text_value is not None else "错误：无法从图片中提取文本。"
+
+            wscore = original_wscore ** sensitivity_factor
+
+            if text_value is None:
+                raise ValueError(f"VLM未能按预期格式返回，无法解析文本。模型返回：\n{vlm_output}")
+            if vlm_cache_key and not cached_vlm:
+                self.vlm_cache.set(vlm_cache_key, {"output": vlm_output})
+
+            # --- 步骤 2: 调用LLM生成批改报告 ---
+            # 从配置加载Prompt模板；未自定义时拆分为稳定的系统提示词与仅含本次数据的用户消息
+            if use_default_template:
+                llm_messages = [
+                    self._system_message(LLM_SYSTEM_PROMPT),
+                    {
+                        "role": "user",
+                        "content": _render_prompt_template(
+                            LLM_USER_TEMPLATE,
+                            topic=topic,
+                            wscore=wscore,
+                            essay_text=essay_text,
+                        ),
+                    },
+                ]
+            else:
+                # 自定义模板无法可靠拆分，沿用单条用户消息
+                final_llm_prompt = _render_prompt_template(
+                    prompt_template,
+                    topic=topic,
+                    wscore=wscore,
+                    essay_text=essay_text
+                )
+                llm_messages = [{"role": "user", "content": final_llm_prompt}]
+
+            llm_payload = {
+                "model": llm_model,
+                "messages": llm_messages,
+                "temperature": llm_temperature,
+                "max_tokens": 4096,
+            }
+        except BaseException:
+            for task in (vlm_task, llm_client_task, warmup_task):
+                if task:
+                    task.cancel()
+            raise
+
+        llm_cache_key = self._llm_cache_key(llm_payload) if self._cache_enabled(llm_temperature) else None
+        cached_llm = self.llm_cache.get(llm_cache_key) if llm_cache_key else None
 
         final_report: str
+        llm_succeeded = False
         try:
-            llm_response_json = self._invoke_chat_completion(
-                "LLM",
-                self.config.get("LlmUrl"),
-                self.config.get("LlmApiKey"),
-                llm_payload,
-                max_retries,
-                retry_delay,
-                request_timeout,
-            )
-            llm_choices = llm_response_json.get("choices") or []
-            if not llm_choices:
-                raise ValueError(f"LLM 未返回 choices，响应：{llm_response_json}")
-            final_report = llm_choices[0].get("message", {}).get("content") or "错误：AI未能生成报告。"
+            if cached_llm:
+                self._log(f"命中LLM批改缓存，跳过LLM调用: {os.path.basename(file_path)}")
+                for task in (llm_client_task, warmup_task):
+                    if task:
+                        task.cancel()
+                final_report = cached_llm["report"]
+                llm_succeeded = True
+                llm_response_json = {}
+            else:
+                if llm_client_task is None:
+                    self._chat_endpoint(self.config.get("LlmUrl"))
+                llm_client = await llm_client_task
+                # 正式请求开始后放弃尚未完成的预热请求
+                if warmup_task and not warmup_task.done():
+                    warmup_task.cancel()
+                llm_response_json = await self._invoke_chat_completion(
+                    "LLM",
+                    llm_client,
+                    llm_payload,
+                    max_retries,
+                    retry_delay,
+                    on_text=on_report_text,
+                )
+                llm_choices = llm_response_json.get("choices") or []
+                if not llm_choices:
+                    raise ValueError(f"LLM 未返回 choices，响应：{llm_response_json}")
+                final_report = llm_choices[0].get("message", {}).get("content") or "错误：AI未能生成报告。"
+                llm_succeeded = bool(llm_choices[0].get("message", {}).get("content"))
+                if llm_succeeded and llm_cache_key:
+                    self.llm_cache.set(llm_cache_key, {"report": final_report})
         except Exception as exc:
             self._log(f"LLM 调用失败：{exc}")
             final_report = f"错误：AI生成报告失败（{exc}）"
             llm_response_json = {}
 
         llm_usage = self._usage_from_response(llm_response_json)
+        if warmup_task and warmup_task.done() and not warmup_task.cancelled():
+            warmup_usage = warmup_task.result()
+            for field in llm_usage:
+                llm_usage[field] += warmup_usage.get(field, 0)
 
-        # 渲染Markdown为HTML（如果配置开启）
-        html_path = None
-        if self.markdown_renderer:
-            # 定义HTML报告的文件名
-            report_base_name = os.path.splitext(file_path)[0]
-            html_output_path = f"{report_base_name}_report.html"
-            
-            html_path = self.markdown_renderer.render_markdown_to_html_file(final_report, html_output_path)
-            if html_path:
-                self._log(f"已生成HTML报告: {os.path.basename(html_path)}")
-        
+        # 等待VLM流读完尾部以取得完整的用量统计；命中识别缓存时没有VLM用量
+        vlm_response_json = {}
+        if vlm_task:
+            try:
+                vlm_response_json = await vlm_task
+            except Exception as exc:  # pylint: disable=broad-except
+                self._log(f"VLM 用量统计获取失败：{exc}")
+        vlm_usage = self._usage_from_response(vlm_response_json)
+
+        if cache_key and llm_succeeded:
+            self.response_cache.set(
+                cache_key,
+                {"report": final_report, "vlm_usage": vlm_usage, "llm_usage": llm_usage},
+            )
+
+        html_path = await self._render_html_report_async(final_report, file_path, render_html)
         return final_report, vlm_usage, llm_usage, html_path
 
 
@@ -347,6 +1201,10 @@ def check_for_updates(current_version_str: str) -> Optional[str]:
     Checks for new releases on GitHub.
     Returns the new version tag if an update is available, otherwise None.
     """
+    import urllib.request  # pylint: disable=import-outside-toplevel
+
+    from packaging import version  # pylint: disable=import-outside-toplevel
+
     try:
         url = "https://api.github.com/repos/Eric-Terminal/Pro_llm_correct/releases/latest"
         # Add a user-agent to avoid being blocked
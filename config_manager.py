@@ -1,11 +1,125 @@
 import json
 import os
 import base64
+import functools
 import hashlib
 import platform
 import subprocess
-from typing import Dict, Optional, Tuple, Any
-from cryptography.fernet import Fernet, InvalidToken
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:  # 可选依赖：orjson 解析与序列化更快，未安装时回退到标准库
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# 设置环境变量 APP_DEBUG 时以缩进格式保存配置，便于人工查看；默认保存为紧凑格式
+_PRETTY_JSON = bool(os.environ.get("APP_DEBUG"))
+
+# Fernet密文（版本字节0x80加时间戳）经Base64编码后的固定前缀
+_FERNET_PREFIX = "gAAAAA"
+
+
+def _as_bool(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in {"1", "true", "yes", "on"}
+    return bool(value)
+
+
+def _derive_fernet_key(password: bytes, salt: bytes) -> bytes:
+    """以带密钥的BLAKE2b派生Fernet密钥，单次哈希即可完成。"""
+    digest = hashlib.blake2b(salt, key=password, digest_size=32, person=b"llm-app-config").digest()
+    return base64.urlsafe_b64encode(digest)
+
+
+@functools.lru_cache(maxsize=8)
+def _derive_legacy_fernet_key(password: bytes, salt: bytes) -> bytes:
+    """
+    旧版本使用的PBKDF2（10万轮）密钥派生，仅用于迁移旧配置文件。
+    结果按(密码, 盐)缓存，同一进程内不再重复计算。
+    """
+    kdf = hashlib.pbkdf2_hmac("sha256", password, salt, 100000)
+    return base64.urlsafe_b64encode(kdf)
+
+
+# 设备信息查询结果（含失败）在进程内缓存，避免每次创建ConfigManager都启动子进程
+_DEVICE_QUERY_CACHE: Dict[str, Any] = {}
+
+
+def _cached_device_query(name: str, query: Callable[[], str]) -> str:
+    """执行一次设备信息查询并缓存结果；查询失败时缓存并重新抛出同一异常。"""
+    if name not in _DEVICE_QUERY_CACHE:
+        try:
+            _DEVICE_QUERY_CACHE[name] = query()
+        except Exception as exc:  # pylint: disable=broad-except
+            _DEVICE_QUERY_CACHE[name] = exc
+    result = _DEVICE_QUERY_CACHE[name]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def _read_machine_id() -> str:
+    with open("/etc/machine-id", "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def _read_dmi_serial() -> str:
+    """读取与 dmidecode -s system-serial-number 相同的序列号；内核默认仅root可读。"""
+    with open("/sys/class/dmi/id/product_serial", "r", encoding="utf-8") as f:
+        serial = f.read().strip()
+    if not serial:
+        raise OSError("product_serial 为空")
+    return serial
+
+
+def _query_dmidecode_serial() -> str:
+    try:
+        return _read_dmi_serial()
+    except OSError:
+        pass
+    # -n：需要密码时直接失败，加载配置时绝不弹出密码提示；调用方经 _cached_device_query 每进程只查询一次
+    return (
+        subprocess.check_output(
+            ["sudo", "-n", "dmidecode", "-s", "system-serial-number"],
+            stderr=subprocess.DEVNULL,
+        )
+        .decode()
+        .strip()
+    )
+
+
+def _query_ioreg_serial() -> str:
+    output = subprocess.check_output(
+        ["ioreg", "-rd1", "-c", "IOPlatformExpertDevice"]
+    ).decode()
+    for line in output.splitlines():
+        if "IOPlatformSerialNumber" in line:
+            return line.split('"')[-2]
+    raise RuntimeError("ioreg 输出中未找到 IOPlatformSerialNumber")
+
+
+class _LazyFernet:
+    """
+    持有Fernet密钥，首次加解密时才导入cryptography并构造Fernet实例。
+    没有敏感字段需要处理时（例如首次启动）完全不加载OpenSSL绑定。
+    """
+
+    def __init__(self, key: bytes):
+        self._key = key
+        self._fernet = None
+
+    def _get(self):
+        if self._fernet is None:
+            from cryptography.fernet import Fernet  # pylint: disable=import-outside-toplevel
+
+            self._fernet = Fernet(self._key)
+        return self._fernet
+
+    def encrypt(self, data: bytes) -> bytes:
+        return self._get().encrypt(data)
+
+    def decrypt(self, token: bytes) -> bytes:
+        return self._get().decrypt(token)
 
 
 class ConfigManager:
@@ -13,9 +127,20 @@ class ConfigManager:
     管理应用的配置（`config.json`），包含加载、保存和敏感字段的加解密逻辑。
     """
 
-    SENSITIVE_KEYS = ["VlmApiKey", "LlmApiKey"]
+    SENSITIVE_KEYS = frozenset(("VlmApiKey", "LlmApiKey"))
+    # 必需配置项及其友好名称，按检查顺序排列
+    _REQUIRED_SETTINGS: Tuple[Tuple[str, str], ...] = (
+        ("VlmUrl", "VLM服务地址"),
+        ("VlmApiKey", "VLM服务密钥"),
+        ("VlmModel", "VLM模型名称"),
+        ("LlmUrl", "LLM服务地址"),
+        ("LlmApiKey", "LLM服务密钥"),
+        ("LlmModel", "LLM模型名称"),
+    )
     _ENCRYPTION_PASSWORD = b"a-strong-but-not-public-password-for-this-app"
     _SALT = b"salt_for_llm_app_config"
+    # 写入配置文件的密钥派生算法标记；缺失表示旧版本的PBKDF2
+    _KDF_NAME = "blake2b"
     _FALLBACK_DEVICE_IDS = {
         "default-device-id-for-encryption",
         "unknown-device-for-security",
@@ -26,13 +151,17 @@ class ConfigManager:
     def __init__(self, file_path: str = "config.json"):
         self.file_path = file_path
         self.config: Dict[str, Any] = {}
-        self._fernet: Optional[Fernet] = None
+        # 敏感字段解密后的明文缓存，避免每次get都做一次Fernet解密
+        self._plain: Dict[str, str] = {}
+        self._fernet: Optional[_LazyFernet] = None
         self._needs_save = False
         self._device_locked = False
+        # Linux 上以 dmidecode 序列号通过指纹校验后，要迁移到的 machine-id
+        self._machine_id_for_migration: Optional[str] = None
 
         self.load()
         self._initialize_encryption()
-        self._ensure_default_render_settings()
+        self._decrypt_sensitive_values()
 
         if self._needs_save:
             self.save()
@@ -41,38 +170,47 @@ class ConfigManager:
         """
         获取设备的唯一标识符（如序列号），用于加密。
         这使得配置文件在另一台机器上无法解密。
+        查询结果在进程内缓存，同一进程中不会重复启动子进程。
         """
         system = platform.system()
         try:
             if system == "Windows":
-                return (
-                    subprocess.check_output(
-                        "wmic bios get serialnumber", shell=True
+                # 直接启动 wmic，不经过 cmd.exe 解析命令行
+                return _cached_device_query(
+                    "wmic",
+                    lambda: subprocess.check_output(
+                        ["wmic", "bios", "get", "serialnumber"]
                     )
                     .decode()
                     .split("\n")[1]
-                    .strip()
+                    .strip(),
                 )
             if system == "Darwin":
-                return (
-                    subprocess.check_output(
-                        "ioreg -l | grep IOPlatformSerialNumber", shell=True
-                    )
-                    .decode()
-                    .split('"')[-2]
-                )
+                # 只查询平台设备节点，而不是导出整棵 IORegistry 再交给 grep 过滤
+                return _cached_device_query("ioreg", _query_ioreg_serial)
             if system == "Linux":
+                # /etc/machine-id 读取廉价：尚无设备指纹或指纹与之一致时直接使用，
+                # 只有旧配置基于 dmidecode 序列号时才需要启动子进程
+                machine_id = None
                 try:
-                    return (
-                        subprocess.check_output(
-                            "sudo dmidecode -s system-serial-number", shell=True
-                        )
-                        .decode()
-                        .strip()
-                    )
+                    machine_id = _cached_device_query("machine-id", _read_machine_id)
+                except OSError:
+                    pass
+                stored_fingerprint = self.config.get("__device_fingerprint__")
+                if machine_id and (
+                    not stored_fingerprint
+                    or stored_fingerprint == hashlib.sha256(machine_id.encode("utf-8")).hexdigest()
+                ):
+                    return machine_id
+                try:
+                    # 优先读取 /sys 中的同一序列号，无权限时才调用 dmidecode
+                    serial = _cached_device_query("dmidecode", _query_dmidecode_serial)
+                    self._machine_id_for_migration = machine_id
+                    return serial
                 except Exception:
-                    with open("/etc/machine-id", "r", encoding="utf-8") as f:
-                        return f.read().strip()
+                    if machine_id:
+                        return machine_id
+                    raise
         except Exception as exc:
             print(f"无法获取设备ID: {exc}，将使用默认值。")
             return "default-device-id-for-encryption"
@@ -106,7 +244,9 @@ class ConfigManager:
             self._needs_save = True
 
         key = self._build_key(device_specific_salt)
-        self._fernet = Fernet(key)
+        self._fernet = _LazyFernet(key)
+        if self.config.get("__kdf__") != self._KDF_NAME:
+            self._upgrade_legacy_kdf(device_specific_salt)
 
         current_fingerprint = hashlib.sha256(device_id.encode("utf-8")).hexdigest()
         stored_fingerprint = self.config.get("__device_fingerprint__")
@@ -131,6 +271,14 @@ class ConfigManager:
                 self.config["__device_fingerprint__"] = current_fingerprint
                 self.config["__device_fingerprint_source__"] = current_source
                 self._needs_save = True
+            elif self._machine_id_for_migration:
+                # 序列号已证明是同一设备：改用无需权限即可读取的 machine-id 作为指纹
+                machine_id = self._machine_id_for_migration
+                self._migrate_encryption(
+                    machine_id,
+                    hashlib.sha256(machine_id.encode("utf-8")).hexdigest(),
+                    "hardware",
+                )
 
     def _derive_salt_from_device(self, device_id: str) -> bytes:
         """将设备ID与固定盐组合为最终的盐值。"""
@@ -138,10 +286,31 @@ class ConfigManager:
 
     def _build_key(self, device_specific_salt: bytes) -> bytes:
         """基于设备盐构造Fernet密钥。"""
-        kdf = hashlib.pbkdf2_hmac(
-            "sha256", self._ENCRYPTION_PASSWORD, device_specific_salt, 100000
-        )
-        return base64.urlsafe_b64encode(kdf)
+        return _derive_fernet_key(self._ENCRYPTION_PASSWORD, device_specific_salt)
+
+    def _upgrade_legacy_kdf(self, device_specific_salt: bytes):
+        """
+        将旧版PBKDF2密钥加密的敏感字段改用当前密钥重新加密，并写入KDF标记。
+        旧密钥无法解密的值（如旧版明文）保持原样，由get()按原有逻辑处理。
+        """
+        if any(self.config.get(key) for key in self.SENSITIVE_KEYS):
+            from cryptography.fernet import InvalidToken  # pylint: disable=import-outside-toplevel
+
+            legacy_fernet = _LazyFernet(
+                _derive_legacy_fernet_key(self._ENCRYPTION_PASSWORD, device_specific_salt)
+            )
+            for key in self.SENSITIVE_KEYS:
+                raw_value = self.config.get(key)
+                if not raw_value:
+                    continue
+                try:
+                    plaintext = legacy_fernet.decrypt(str(raw_value).encode("utf-8"))
+                except InvalidToken:
+                    continue
+                self.config[key] = self._fernet.encrypt(plaintext).decode("utf-8")
+
+        self.config["__kdf__"] = self._KDF_NAME
+        self._needs_save = True
 
     @staticmethod
     def _is_probably_encrypted(value: Any) -> bool:
@@ -149,7 +318,7 @@ class ConfigManager:
         粗略判断一个值是否像Fernet密文。
         Fernet密文通常以'gAAAAA'开头，这里用作启发式判断。
         """
-        return isinstance(value, str) and value.startswith("gAAAAA")
+        return isinstance(value, str) and value.startswith(_FERNET_PREFIX)
 
     def _encrypt(self, value: str) -> str:
         """使用Fernet实例加密字符串。"""
@@ -157,13 +326,6 @@ class ConfigManager:
             return ""
         return self._fernet.encrypt(value.encode("utf-8")).decode("utf-8")
 
-    def _ensure_default_render_settings(self):
-        """确保渲染相关默认配置存在。"""
-        if self.get("SaveMarkdown") is None:
-            self.set("SaveMarkdown", True)
-        if self.get("RenderMarkdown") is None:
-            self.set("RenderMarkdown", True)
-
     def _decrypt(self, encrypted_value: str) -> str:
         """
         使用Fernet实例解密字符串。
@@ -171,6 +333,8 @@ class ConfigManager:
         """
         if not encrypted_value or not self._fernet or self._device_locked:
             return ""
+        from cryptography.fernet import InvalidToken  # pylint: disable=import-outside-toplevel
+
         try:
             return self._fernet.decrypt(encrypted_value.encode("utf-8")).decode("utf-8")
         except InvalidToken:
@@ -197,7 +361,7 @@ class ConfigManager:
 
         new_salt = self._derive_salt_from_device(new_device_id)
         new_key = self._build_key(new_salt)
-        new_fernet = Fernet(new_key)
+        new_fernet = _LazyFernet(new_key)
 
         for key, value in plaintext_cache.items():
             self.config[key] = new_fernet.encrypt(value.encode("utf-8")).decode("utf-8")
@@ -209,28 +373,70 @@ class ConfigManager:
         self._fernet = new_fernet
         self._needs_save = True
 
+    def _decrypt_sensitive_values(self):
+        """
+        一次性解密全部敏感字段并缓存明文，get()直接读取缓存。
+        旧版本遗留的明文值会顺带加密，随后保存。
+        """
+        self._plain = {}
+        for key in self.SENSITIVE_KEYS:
+            raw_value = self.config.get(key)
+            if raw_value is None:
+                continue
+            stored = raw_value if isinstance(raw_value, str) else str(raw_value)
+            decrypted = self._decrypt(stored)
+            if not decrypted:
+                continue
+            self._plain[key] = decrypted
+            if decrypted == stored and not self._is_probably_encrypted(stored):
+                self.set(key, decrypted)
+
     def load(self) -> bool:
         """从JSON文件加载配置，如不存在则初始化为空配置。"""
+        self._plain = {}
         if not os.path.exists(self.file_path):
             self.config = {}
             self._needs_save = True
             return True
         try:
-            with open(self.file_path, "r", encoding="utf-8") as file:
-                self.config = json.load(file)
+            # 一次读入全部字节再解析，由解析器直接处理UTF-8
+            with open(self.file_path, "rb") as file:
+                raw = file.read()
+            self.config = orjson.loads(raw) if orjson is not None else json.loads(raw)
             return True
-        except (json.JSONDecodeError, IOError):
+        except (ValueError, IOError):  # 含 JSONDecodeError 与非法UTF-8
             self.config = {}
             return False
 
     def save(self):
-        """将当前配置写入JSON文件。"""
+        """
+        将当前配置写入JSON文件；自上次保存以来没有修改时直接跳过。
+        先写入临时文件再原子替换，写入中途崩溃也不会留下损坏的配置文件。
+        """
+        if not self._needs_save:
+            return
+        if orjson is not None:
+            data = orjson.dumps(self.config, option=orjson.OPT_INDENT_2 if _PRETTY_JSON else None)
+        elif _PRETTY_JSON:
+            # 与 orjson 的 OPT_INDENT_2 输出逐字节一致，是否安装 orjson 不影响配置文件格式
+            data = json.dumps(self.config, ensure_ascii=False, indent=2).encode("utf-8")
+        else:
+            data = json.dumps(self.config, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        tmp_path = f"{self.file_path}.tmp"
         try:
-            with open(self.file_path, "w", encoding="utf-8") as file:
-                json.dump(self.config, file, indent=4)
+            with open(tmp_path, "wb") as file:
+                file.write(data)
+                # 替换前落盘，避免断电后出现已改名但内容为空的配置文件
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.file_path)
             self._needs_save = False
-        except IOError as exc:
+        except OSError as exc:
             print(f"保存配置失败: {exc}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
 
     def get(self, key: str, default: Optional[Any] = None) -> Optional[Any]:
         """读取指定配置项，对敏感字段自动解密。"""
@@ -239,46 +445,78 @@ class ConfigManager:
             return default
 
         if key in self.SENSITIVE_KEYS:
-            decrypted = self._decrypt(str(value))
-            if decrypted and decrypted == str(value) and not self._is_probably_encrypted(value):
-                self.set(key, decrypted)
-                self.save()
-            return decrypted if decrypted else default
+            return self._plain.get(key) or default
         return value
 
     def set(self, key: str, value: Any):
         """写入指定配置项，对敏感字段自动加密。"""
         if key in self.SENSITIVE_KEYS:
-            self.config[key] = self._encrypt(str(value))
+            encrypted = self._encrypt(str(value))
+            self.config[key] = encrypted
+            if encrypted:
+                self._plain[key] = str(value)
+            else:
+                self._plain.pop(key, None)
         else:
             self.config[key] = value
         self._needs_save = True
 
+    def set_if_changed(self, key: str, value: Any) -> bool:
+        """
+        仅当值与当前值不同时写入，返回是否发生了修改。
+        敏感字段与缓存的明文比较，未变化时不重新加密（Fernet每次加密都会生成不同的密文）。
+        """
+        if key in self.SENSITIVE_KEYS:
+            current = self._plain.get(key)
+            if current is not None and current == str(value):
+                return False
+        elif key in self.config and self.config[key] == value:
+            return False
+        self.set(key, value)
+        return True
+
+    def remove(self, key: str) -> bool:
+        """删除指定配置项（含敏感字段的明文缓存），返回该项此前是否存在。"""
+        self._plain.pop(key, None)
+        if key not in self.config:
+            return False
+        del self.config[key]
+        self._needs_save = True
+        return True
+
+    def update_many(self, values: Dict[str, Any]) -> bool:
+        """
+        批量写入多个配置项，值为None的项会被删除，返回是否有任何修改。
+        只更新内存中的配置，调用方在修改后统一调用一次save()。
+        """
+        changed = False
+        for key, value in values.items():
+            if value is None:
+                changed = self.remove(key) or changed
+            else:
+                changed = self.set_if_changed(key, value) or changed
+        return changed
+
     def update_token_usage(self, vlm_input: int, vlm_output: int, llm_input: int, llm_output: int):
-        """累加本次调用的token用量统计。"""
-        self.config["UsageVlmInput"] = self.get("UsageVlmInput", 0) + vlm_input
-        self.config["UsageVlmOutput"] = self.get("UsageVlmOutput", 0) + vlm_output
-        self.config["UsageLlmInput"] = self.get("UsageLlmInput", 0) + llm_input
-        self.config["UsageLlmOutput"] = self.get("UsageLlmOutput", 0) + llm_output
+        """累加本次调用的token用量统计（计数器不是敏感字段，直接操作配置字典）。"""
+        config = self.config
+        config["UsageVlmInput"] = (config.get("UsageVlmInput") or 0) + vlm_input
+        config["UsageVlmOutput"] = (config.get("UsageVlmOutput") or 0) + vlm_output
+        config["UsageLlmInput"] = (config.get("UsageLlmInput") or 0) + llm_input
+        config["UsageLlmOutput"] = (config.get("UsageLlmOutput") or 0) + llm_output
         self._needs_save = True
 
-    def check_settings(self) -> Tuple[bool, Optional[str]]:
+    def check_settings(self, fused: bool = False) -> Tuple[bool, Optional[str]]:
         """
         检查所有必需配置项是否已设置。
+        fused 为 True（FusedMode）时不调用VLM，跳过VLM相关配置项。
         返回 (是否完整, 第一个缺失项的友好名称)。
         """
-        required_settings = {
-            "VlmUrl": "VLM服务地址",
-            "VlmApiKey": "VLM服务密钥",
-            "VlmModel": "VLM模型名称",
-            "LlmUrl": "LLM服务地址",
-            "LlmApiKey": "LLM服务密钥",
-            "LlmModel": "LLM模型名称",
-            "MaxRetries": "最大重试次数",
-            "RetryDelay": "重试延迟时间(秒)",
-        }
-        for key, name in required_settings.items():
-            if not self.get(key):
+        for key, name in self._REQUIRED_SETTINGS:
+            if fused and key.startswith("Vlm"):
+                continue
+            value = self._plain.get(key) if key in self.SENSITIVE_KEYS else self.config.get(key)
+            if not value:
                 return False, name
         return True, None
 
@@ -16,21 +16,20 @@ def get_config_path():
     获取配置文件的合适路径。
     在开发环境使用当前目录，在打包环境使用exe所在目录。
     """
-    try:
-        # 检查是否在PyInstaller打包环境中
-        sys._MEIPASS
+    # 检查是否在PyInstaller打包环境中（打包后 sys 上存在 _MEIPASS 属性）
+    if getattr(sys, "_MEIPASS", None):
         # 如果是打包环境，使用exe文件所在目录
         exe_dir = os.path.dirname(sys.executable)
         return os.path.join(exe_dir, "config.json")
-    except Exception:
-        # 开发环境，使用当前目录
-        return "config.json"
+    # 开发环境，使用当前目录
+    return "config.json"
 
 def find_available_port(start: int = 4567, limit: int = 4667) -> int:
     """Return the first free TCP port within the inclusive range."""
-    for port in range(start, limit + 1):
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    # A failed bind leaves the socket unbound, so one socket serves the whole scan.
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        for port in range(start, limit + 1):
             try:
                 sock.bind(("127.0.0.1", port))
                 return port
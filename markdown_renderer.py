@@ -1,53 +1,10 @@
+import functools
 import os
-import markdown
-from config_manager import ConfigManager
-from typing import Optional
+from config_manager import ConfigManager, _as_bool
+from typing import Callable, Optional
 
-class MarkdownRenderer:
-    """Markdown渲染器，支持将Markdown文本渲染为带样式的HTML文件"""
-
-    def __init__(self, config_manager: ConfigManager):
-        self.config_manager = config_manager
-
-    def render_markdown_to_html_file(self, markdown_text: str, output_path: str) -> Optional[str]:
-        """
-        将Markdown文本渲染为带样式的HTML文件。
-
-        Args:
-            markdown_text: Markdown格式的文本。
-            output_path: 输出HTML文件的路径。
-
-        Returns:
-            如果成功，返回生成的HTML文件路径；否则返回None。
-        """
-        # 检查配置中的RenderMarkdown设置，默认开启
-        render_enabled = self.config_manager.get("RenderMarkdown")
-        if render_enabled is None:
-            # 如果配置中没有设置，使用默认值True
-            render_enabled = True
-        
-        if not render_enabled:
-            return None
-
-        try:
-            # 将Markdown转换为HTML
-            html_body = markdown.markdown(markdown_text, extensions=['extra', 'tables'])
-            
-            # 组装完整的HTML文档，并嵌入CSS样式
-            full_html = self._wrap_with_style(html_body)
-
-            # 将HTML内容写入文件
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(full_html)
-            
-            return output_path
-        except Exception as e:
-            print(f"渲染Markdown到HTML文件时出错: {e}")
-            return None
-    
-    def _wrap_with_style(self, html_body: str) -> str:
-        """将HTML内容包裹在带有预设CSS样式的完整HTML结构中"""
-        css_style = """
+# 报告HTML外壳（含CSS样式）是固定内容，在模块加载时拼好并预先编码，渲染时只需编码正文
+_CSS_STYLE = """
         <style>
             body {
                 font-family: 'Arial', 'Microsoft YaHei', sans-serif;
@@ -120,21 +77,102 @@ class MarkdownRenderer:
             }
         </style>
         """
-        return f"""
+_HTML_PREFIX = f"""
         <!DOCTYPE html>
         <html lang="zh-CN">
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>作文批改报告</title>
-            {css_style}
+            {_CSS_STYLE}
         </head>
         <body>
-            {html_body}
+            """
+_HTML_SUFFIX = """
         </body>
         </html>
         """
 
+
+def _compact_lines(text: str) -> bytes:
+    """去掉每行的缩进与空行后编码；外壳按固定字节写出，缩进只会增加文件体积。"""
+    lines = (line.strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line).encode("utf-8") + b"\n"
+
+
+_HTML_PREFIX_BYTES = _compact_lines(_HTML_PREFIX)
+_HTML_SUFFIX_BYTES = _compact_lines(_HTML_SUFFIX)
+
+
+
+@functools.lru_cache(maxsize=1)
+def _load_markdown_converter() -> Callable[[str], str]:
+    """
+    按需创建Markdown转换函数并在进程内复用。
+    优先使用解析更快的可选依赖 mistune（需 2.x 及以上，0.8.x 没有 create_markdown），
+    否则回退到 markdown 包。mistune 保留原始HTML，并启用与 markdown 的 extra 扩展
+    对应的表格、脚注、定义列表与缩写插件，使两种路径生成的报告一致。
+    """
+    try:
+        import mistune
+    except ImportError:
+        mistune = None
+    if mistune is not None and hasattr(mistune, "create_markdown"):
+        return mistune.create_markdown(
+            escape=False,
+            plugins=['table', 'strikethrough', 'footnotes', 'def_list', 'abbr'],
+        )
+    import markdown
+    return functools.partial(markdown.markdown, extensions=['extra', 'tables'])
+
+
+class MarkdownRenderer:
+    """Markdown渲染器，支持将Markdown文本渲染为带样式的HTML文件"""
+
+    def __init__(self, config_manager: ConfigManager):
+        self.config_manager = config_manager
+        self._render_enabled = True
+        self.refresh()
+
+    def refresh(self):
+        """重新读取RenderMarkdown配置（未设置时默认开启），配置在运行时修改后需调用。"""
+        self._render_enabled = _as_bool(self.config_manager.get("RenderMarkdown", True))
+
+    def render_markdown_to_html_file(
+        self, markdown_text: str, output_path: str, enabled: Optional[bool] = None
+    ) -> Optional[str]:
+        """
+        将Markdown文本渲染为带样式的HTML文件。
+
+        Args:
+            markdown_text: Markdown格式的文本。
+            output_path: 输出HTML文件的路径。
+            enabled: 调用方已确定的渲染开关（如任务开始时的快照）；为None时使用缓存的配置。
+
+        Returns:
+            如果成功，返回生成的HTML文件路径；否则返回None。
+        """
+        # RenderMarkdown设置已在初始化/refresh()时读取，避免每次渲染都查询配置
+        if enabled is None:
+            enabled = self._render_enabled
+        if not enabled:
+            return None
+
+        try:
+            # 将Markdown转换为HTML（解析库仅在首次渲染时导入，不拖慢启动）
+            html_body = _load_markdown_converter()(markdown_text)
+            
+            # 依次写出预编码的外壳与正文，不再拼接出整份HTML的副本
+            with open(output_path, 'wb', buffering=1 << 16) as f:
+                f.write(_HTML_PREFIX_BYTES)
+                f.write(html_body.encode('utf-8'))
+                f.write(_HTML_SUFFIX_BYTES)
+            
+            return output_path
+        except Exception as e:
+            print(f"渲染Markdown到HTML文件时出错: {e}")
+            return None
+
 # 工具函数
 def create_markdown_renderer(config_manager: ConfigManager) -> MarkdownRenderer:
     """创建Markdown渲染器实例"""
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# 每个缓存目录最多保留的缓存项数量；超出后按最近使用时间淘汰最旧的条目
+DEFAULT_MAX_ENTRIES = 2000
+# 淘汰时清理到上限的该比例，避免缓存满后每次写入都重新扫描目录
+_PRUNE_RATIO = 0.9
+
+
+class ResponseCache:
+    """
+    基于文件的本地响应缓存：每个键对应缓存目录下的一个JSON文件。
+    写入先落到临时文件再原子替换，多线程并发读写安全。
+    条目数超过 max_entries 时按文件修改时间淘汰最久未使用的条目（命中时会刷新修改时间）。
+    """
+
+    def __init__(self, directory: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        # 目录中的条目数，首次写入时扫描一次，之后在写入/淘汰时增量维护
+        self._entry_count: Optional[int] = None
+        self._count_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """将若干字符串片段组合为稳定的SHA-256缓存键。"""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    @staticmethod
+    def file_digest(path: str) -> str:
+        """计算文件内容的SHA-256摘要。"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存项，不存在或已损坏时返回None。"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                value = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return None
+        try:
+            # 刷新修改时间，使淘汰顺序接近 LRU
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]):
+        """写入缓存项。"""
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            is_new = not os.path.exists(path)
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(value, file, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            print(f"写入响应缓存失败: {exc}")
+            return
+        if is_new:
+            self._record_new_entry()
+
+    def _list_entries(self) -> List[Tuple[float, str]]:
+        """返回缓存目录中所有条目的 (修改时间, 路径)。"""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        return entries
+
+    def _record_new_entry(self):
+        """记录新增的条目，超过上限时淘汰最久未使用的条目。"""
+        if self.max_entries <= 0:
+            return
+        with self._count_lock:
+            if self._entry_count is None:
+                self._entry_count = len(self._list_entries())
+            else:
+                self._entry_count += 1
+            if self._entry_count <= self.max_entries:
+                return
+            entries = self._list_entries()
+            entries.sort()
+            keep = int(self.max_entries * _PRUNE_RATIO)
+            remaining = len(entries)
+            for _, path in entries[: max(len(entries) - keep, 0)]:
+                try:
+                    os.remove(path)
+                    remaining -= 1
+                except OSError:
+                    continue
+            self._entry_count = remaining
+
+    def clear(self) -> int:
+        """清空缓存目录中的所有缓存项，返回删除的数量。"""
+        # 无需加锁：并发的 clear/set 互不破坏，已被他人删除的文件按 OSError 跳过即可
+        removed = 0
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return 0
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+                removed += 1
+            except OSError:
+                continue
+        with self._count_lock:
+            self._entry_count = None
+        return removed
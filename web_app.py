@@ -1,9 +1,16 @@
+import asyncio
+import gzip
+import hashlib
 import logging
+import os
+import shutil
 import threading
+import time
+import traceback
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime
+from functools import partial
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from flask import (
     Flask,
@@ -12,15 +19,38 @@ from flask import (
     render_template_string,
     request,
     send_from_directory,
+    url_for,
 )
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.utils import secure_filename
 
+try:  # 可选依赖：安装 orjson 后 API 响应改用其序列化
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
 from api_services import ApiService, DEFAULT_LLM_PROMPT_TEMPLATE, check_for_updates
 from config_manager import ConfigManager
 from version import CURRENT_VERSION
 
 
 DEFAULT_OUTPUT_DIR_NAME = "output_reports"
+# 与用户提交内容比较时使用的默认模板（已去除首尾空白），导入时计算一次
+DEFAULT_TEMPLATE_NORMALIZED = DEFAULT_LLM_PROMPT_TEMPLATE.strip()
+# 内存中保留的批改任务状态上限，超出后丢弃最早的已结束任务
+MAX_RETAINED_RUNS = 50
+# 落盘线程池的大小上限，与模型调用并发数（MaxWorkers）无关
+POSTPROCESS_MAX_WORKERS = 4
+# 保存上传文件时每次读取的字节数
+UPLOAD_CHUNK_SIZE = 1 << 16
+# 页面加载时 loadConfig() 请求的地址，HTML 中以 preload 提前获取
+INDEX_CONFIG_URL = "/api/config?prompt=0"
+# /api/run-stream 无状态变化时发送保活注释的间隔（秒）
+RUN_STREAM_KEEPALIVE = 15
+# /outputs 下报告与原图的浏览器缓存时间（秒）
+OUTPUT_CACHE_MAX_AGE = 3600
+# /assets 下的样式与脚本文件名带内容哈希，内容变化即换地址，可按一年缓存且标记为 immutable
+ASSET_CACHE_MAX_AGE = 365 * 24 * 3600
 
 
 def _ensure_directory(path: Path) -> Path:
@@ -28,500 +58,113 @@ def _ensure_directory(path: Path) -> Path:
     return path
 
 
-def _as_bool(value: Any, default: bool) -> bool:
-    if value is None:
-        return default
-    if isinstance(value, bool):
-        return value
-    if isinstance(value, str):
-        return value.strip().lower() in {"1", "true", "yes", "on"}
-    return bool(value)
-
-
-def _usage_snapshot(raw: Optional[Dict[str, Any]]) -> Dict[str, int]:
-    raw = raw or {}
-    return {
-        "prompt_tokens": int(raw.get("prompt_tokens", 0) or 0),
-        "completion_tokens": int(raw.get("completion_tokens", 0) or 0),
-    }
-
-
-def create_app(config_manager: ConfigManager) -> Flask:
-    """Create and configure the Flask web application."""
-
-    app = Flask(__name__)
-    app.config["MAX_CONTENT_LENGTH"] = 100 * 1024 * 1024  # 100 MB payload ceiling
-    app.logger.handlers.clear()
-    app.logger.propagate = True
-    logger = logging.getLogger("essay_corrector.web")
-
-    api_service = ApiService(config_manager)
-    config_lock = threading.Lock()
-    update_state: Dict[str, Optional[str]] = {"latest": None, "checked": None}
-    update_lock = threading.Lock()
-    run_states: Dict[str, Dict[str, Any]] = {}
-    run_states_lock = threading.Lock()
-
-    def get_output_root() -> Path:
-        configured = config_manager.get("OutputDirectory")
-        base_path = Path(configured) if configured else Path(DEFAULT_OUTPUT_DIR_NAME)
-        if not base_path.is_absolute():
-            base_path = Path.cwd() / base_path
-        return _ensure_directory(base_path)
-
-    def relative_to_output(path: Path) -> str:
-        root = get_output_root().resolve()
-        resolved = path.resolve()
-        try:
-            relative = resolved.relative_to(root)
-        except ValueError as exc:  # pragma: no cover - safety guard
-            raise ValueError("Requested path is outside of the output directory") from exc
-        return relative.as_posix()
-
-    def start_update_check(force: bool = False) -> None:
-        if not _as_bool(config_manager.get("AutoUpdateCheck", True), True):
-            return
-
-        with update_lock:
-            already_checked = update_state["checked"]
-
-        if already_checked and not force:
-            return
-
-        def _worker() -> None:
-            latest = check_for_updates(CURRENT_VERSION)
-            timestamp = datetime.now().isoformat(timespec="seconds")
-            with update_lock:
-                update_state["latest"] = latest
-                update_state["checked"] = timestamp
-
-        threading.Thread(target=_worker, daemon=True).start()
-
-    def _execute_run(
-        run_id: str,
-        saved_files: List[Dict[str, Any]],
-        topic: str,
-        run_dir: Path,
-        max_workers: int,
-        save_markdown: bool,
-    ) -> None:
-        aggregate = {"vlm_in": 0, "vlm_out": 0, "llm_in": 0, "llm_out": 0}
-        failures = 0
-
-        with run_states_lock:
-            state = run_states.get(run_id)
-            if state:
-                state["status"] = "running"
-
-        def process_single(file_info: Dict[str, Any]) -> Dict[str, Any]:
-            saved_path: Path = file_info["path"]
-            logs: List[str] = [f"开始处理: {file_info['original']}"]
-            markdown_path: Optional[Path] = None
-            html_path: Optional[Path] = None
-            vlm_usage = {"prompt_tokens": 0, "completion_tokens": 0}
-            llm_usage = {"prompt_tokens": 0, "completion_tokens": 0}
-            error: Optional[str] = None
-            rendered_html_path: Optional[str] = None
-
-            report_markdown_path = saved_path.parent / f"{saved_path.stem}_report.md"
-
-            try:
-                final_report, raw_vlm_usage, raw_llm_usage, rendered_html_path = api_service.process_essay_image(
-                    str(saved_path),
-                    topic,
-                )
-
-                vlm_usage = _usage_snapshot(raw_vlm_usage)
-                llm_usage = _usage_snapshot(raw_llm_usage)
-
-                if save_markdown:
-                    markdown_path = report_markdown_path
-                    markdown_path.write_text(final_report, encoding="utf-8")
-                    logs.append(f"已生成 Markdown: {markdown_path.name}")
+class _OrjsonProvider(DefaultJSONProvider):
+    """使用 orjson 编解码 JSON（状态轮询响应较大时序列化更快），不支持的类型沿用 Flask 的默认转换。"""
 
-                render_html = _as_bool(config_manager.get("RenderMarkdown", True), True)
-                if rendered_html_path:
-                    html_path = Path(rendered_html_path)
-                    logs.append(f"已生成 HTML: {html_path.name}")
-                    if not save_markdown and render_html and report_markdown_path.exists():
-                        report_markdown_path.unlink(missing_ok=True)
-                        logs.append("已删除 Markdown（仅保留 HTML）")
-                elif not save_markdown and report_markdown_path.exists():
-                    report_markdown_path.unlink(missing_ok=True)
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=kwargs.get("default", self.default), option=option).decode("utf-8")
 
-                with config_lock:
-                    config_manager.update_token_usage(
-                        vlm_usage["prompt_tokens"],
-                        vlm_usage["completion_tokens"],
-                        llm_usage["prompt_tokens"],
-                        llm_usage["completion_tokens"],
-                    )
-                    config_manager.save()
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
 
-            except Exception as exc:  # pylint: disable=broad-except
-                logger.exception("文件处理失败: %s", saved_path)
-                error = str(exc)
-                logs.append(f"处理失败: {error}")
 
-            saved_rel = relative_to_output(saved_path)
-            markdown_rel = relative_to_output(markdown_path) if markdown_path else None
-            if rendered_html_path:
-                html_rel = relative_to_output(Path(rendered_html_path))
-            else:
-                html_rel = relative_to_output(html_path) if html_path else None
+def _run_status_payload(run_id: str, state: Dict[str, Any], since: int = 0) -> Dict[str, Any]:
+    """
+    由任务状态快照构建 /api/run-status 与 /api/run-stream 的响应内容。
+    since 为客户端已收到的最大 seq，results 只包含此后完成的文件。
+    """
+    results = state["results"]
+    if since > 0:
+        results = [item for item in results if item["seq"] > since]
+    return {
+        "run_id": run_id,
+        "status": state.get("status", "unknown"),
+        "total": state.get("total", 0),
+        "completed": state.get("completed", 0),
+        "last_seq": state.get("completed", 0),
+        "aggregate": state["aggregate"],
+        "results": results,
+        "streaming": state["streaming"],
+        "run_path": state.get("run_path"),
+        "error": state.get("error"),
+        "errors": state["errors"],
+    }
 
-            return {
-                "index": file_info["index"],
-                "original": file_info["original"],
-                "saved": saved_rel,
-                "markdown": markdown_rel,
-                "html": html_rel,
-                "vlm_usage": vlm_usage,
-                "llm_usage": llm_usage,
-                "logs": logs,
-                "error": error,
-            }
 
+def _create_run_directory(output_root: Path) -> Tuple[str, Path]:
+    """
+    以时间戳为 run id 创建任务目录；同一秒内已有任务时依次追加 -1、-2 … 后缀。
+    目录创建本身是原子的，并发提交不会共用同一目录或覆盖彼此的任务状态。
+    """
+    base_id = time.strftime("%Y%m%d-%H%M%S")
+    run_id = base_id
+    suffix = 0
+    while True:
+        run_dir = output_root / run_id
         try:
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                futures = [executor.submit(process_single, info) for info in saved_files]
-                for future in as_completed(futures):
-                    result = future.result()
-                    if not result["error"]:
-                        aggregate["vlm_in"] += result["vlm_usage"]["prompt_tokens"]
-                        aggregate["vlm_out"] += result["vlm_usage"]["completion_tokens"]
-                        aggregate["llm_in"] += result["llm_usage"]["prompt_tokens"]
-                        aggregate["llm_out"] += result["llm_usage"]["completion_tokens"]
-                    else:
-                        failures += 1
-
-                    with run_states_lock:
-                        state = run_states.get(run_id)
-                        if not state:
-                            continue
-                        state["completed"] = state.get("completed", 0) + 1
-                        state.setdefault("results", {})[result["index"]] = result
-                        state["aggregate"] = aggregate.copy()
-                        if result["error"]:
-                            state.setdefault("errors", []).append(
-                                {"index": result["index"], "message": result["error"]}
-                            )
-        except Exception as exc:  # pylint: disable=broad-except
-            logging.exception("批处理任务失败: %s", run_id)
-            with run_states_lock:
-                state = run_states.get(run_id)
-                if state:
-                    state["status"] = "failed"
-                    state["error"] = str(exc)
-                    state["aggregate"] = aggregate
-                    state["finished_at"] = datetime.now().isoformat(timespec="seconds")
-            return
-
-        total = len(saved_files)
-        if total == 0:
-            status = "empty"
-        elif failures == 0:
-            status = "ok"
-        elif failures == total:
-            status = "failed"
-        else:
-            status = "partial"
-
-        with run_states_lock:
-            state = run_states.get(run_id)
-            if state:
-                state["status"] = status
-                state["aggregate"] = aggregate
-                state["completed"] = total
-                state["finished_at"] = datetime.now().isoformat(timespec="seconds")
-
-    @app.get("/api/config")
-    def read_config():
-        usage = {
-            "vlm_input": int(config_manager.get("UsageVlmInput", 0) or 0),
-            "vlm_output": int(config_manager.get("UsageVlmOutput", 0) or 0),
-            "llm_input": int(config_manager.get("UsageLlmInput", 0) or 0),
-            "llm_output": int(config_manager.get("UsageLlmOutput", 0) or 0),
-        }
-
-        with update_lock:
-            latest_version = update_state["latest"]
-            checked_at = update_state["checked"]
-
-        has_vlm_key = bool(config_manager.get("VlmApiKey"))
-        has_llm_key = bool(config_manager.get("LlmApiKey"))
-
-        data = {
-            "VlmUrl": config_manager.get("VlmUrl", ""),
-            "VlmApiKey": "",
-            "HasVlmApiKey": has_vlm_key,
-            "VlmModel": config_manager.get("VlmModel", ""),
-            "VlmTemperature": config_manager.get("VlmTemperature", 0.0),
-            "LlmUrl": config_manager.get("LlmUrl", ""),
-            "LlmApiKey": "",
-            "HasLlmApiKey": has_llm_key,
-            "LlmModel": config_manager.get("LlmModel", ""),
-            "LlmTemperature": config_manager.get("LlmTemperature", 0.0),
-            "SensitivityFactor": config_manager.get("SensitivityFactor", "1.0"),
-            "MaxWorkers": config_manager.get("MaxWorkers", 4),
-            "MaxRetries": config_manager.get("MaxRetries", 3),
-            "RetryDelay": config_manager.get("RetryDelay", 5),
-            "RequestTimeout": config_manager.get("RequestTimeout", 120),
-            "SaveMarkdown": _as_bool(config_manager.get("SaveMarkdown", True), True),
-            "RenderMarkdown": _as_bool(config_manager.get("RenderMarkdown", True), True),
-            "AutoUpdateCheck": _as_bool(config_manager.get("AutoUpdateCheck", True), True),
-            "LlmPromptTemplate": config_manager.get("LlmPromptTemplate") or DEFAULT_LLM_PROMPT_TEMPLATE,
-            "OutputDirectory": str(config_manager.get("OutputDirectory", DEFAULT_OUTPUT_DIR_NAME)),
-            "Usage": usage,
-            "CurrentVersion": CURRENT_VERSION,
-            "LatestVersion": latest_version,
-            "CheckedAt": checked_at,
-        }
-        return jsonify(data)
+            run_dir.mkdir(parents=True)
+            return run_id, run_dir
+        except FileExistsError:
+            suffix += 1
+            run_id = f"{base_id}-{suffix}"
 
-    @app.post("/api/config")
-    def update_config():
-        payload = request.get_json(silent=True) or {}
 
-        string_fields = [
-            "VlmUrl",
-            "VlmModel",
-            "LlmUrl",
-            "LlmModel",
-            "OutputDirectory",
-        ]
-        sensitive_fields = [
-            "VlmApiKey",
-            "LlmApiKey",
-        ]
-        int_fields = ["MaxWorkers", "MaxRetries", "RetryDelay"]
-        float_fields = {
-            "RequestTimeout": (1.0, None),
-            "VlmTemperature": (0.0, 2.0),
-            "LlmTemperature": (0.0, 2.0),
-        }
-        bool_fields = ["SaveMarkdown", "RenderMarkdown", "AutoUpdateCheck"]
+def _now_iso() -> str:
+    """当前本地时间，精确到秒的ISO 8601字符串（time.strftime 直接格式化，不构造 datetime 对象）。"""
+    return time.strftime("%Y-%m-%dT%H:%M:%S")
 
-        updates: Dict[str, Any] = {}
 
-        for key in string_fields:
-            if key in payload:
-                value = (payload.get(key) or "").strip()
-                if key == "OutputDirectory" and not value:
-                    return jsonify({"error": "输出目录不能为空"}), 400
-                updates[key] = value
+_TRUE_STRINGS = frozenset({"1", "true", "yes", "on"})
 
-        for key in sensitive_fields:
-            if key in payload:
-                value = (payload.get(key) or "").strip()
-                if value:
-                    updates[key] = value
 
-        if payload.get("ClearVlmApiKey"):
-            updates["VlmApiKey"] = ""
-        if payload.get("ClearLlmApiKey"):
-            updates["LlmApiKey"] = ""
+def _as_bool(value: Any, default: bool) -> bool:
+    # 配置中的布尔项绝大多数已是 bool，优先判断
+    if value.__class__ is bool:
+        return value
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in _TRUE_STRINGS
+    return bool(value)
 
-        for key in int_fields:
-            if key in payload and payload[key] not in (None, ""):
-                try:
-                    updates[key] = int(payload[key])
-                except (TypeError, ValueError):
-                    return jsonify({"error": f"{key} 需要是整数"}), 400
 
-        for key, bounds in float_fields.items():
-            if key in payload and payload[key] not in (None, ""):
-                try:
-                    value = float(payload[key])
-                except (TypeError, ValueError):
-                    return jsonify({"error": f"{key} 需要是数字"}), 400
-                min_val, max_val = bounds
-                if min_val is not None and value < min_val:
-                    return jsonify({"error": f"{key} 不能小于 {min_val}"}), 400
-                if max_val is not None and value > max_val:
-                    return jsonify({"error": f"{key} 不能大于 {max_val}"}), 400
-                updates[key] = value
+async def _make_semaphore(limit: int) -> asyncio.Semaphore:
+    return asyncio.Semaphore(limit)
 
-        if "SensitivityFactor" in payload and payload["SensitivityFactor"] not in (None, ""):
-            try:
-                updates["SensitivityFactor"] = float(payload["SensitivityFactor"])
-            except (TypeError, ValueError):
-                return jsonify({"error": "SensitivityFactor 需要是数字"}), 400
 
-        for key in bool_fields:
-            if key in payload:
-                updates[key] = bool(payload[key])
+def _write_text_file(path: Path, content: str) -> None:
+    """预先编码为UTF-8后用 os.write 直接写入，绕过文本IO层的逐段编码与换行转换。"""
+    data = memoryview(content.encode("utf-8"))
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+    fd = os.open(path, flags, 0o644)
+    try:
+        while data:
+            written = os.write(fd, data)
+            data = data[written:]
+    finally:
+        os.close(fd)
 
-        prompt_template = payload.get("LlmPromptTemplate")
-        if prompt_template is not None:
-            normalized = str(prompt_template).strip()
-            if not normalized:
-                updates["LlmPromptTemplate"] = None
-            elif normalized == DEFAULT_LLM_PROMPT_TEMPLATE.strip():
-                updates["LlmPromptTemplate"] = None
-            else:
-                updates["LlmPromptTemplate"] = normalized
 
-        with config_lock:
-            for key, value in updates.items():
-                if key == "LlmPromptTemplate" and value is None:
-                    config_manager.config.pop(key, None)
-                elif key in ("VlmApiKey", "LlmApiKey") and value == "":
-                    config_manager.config.pop(key, None)
-                else:
-                    config_manager.set(key, value)
-            config_manager.save()
+def _parse_max_workers(value: Any) -> int:
+    try:
+        return max(int(value), 0) or 1
+    except (TypeError, ValueError):
+        return 4
 
-        if "OutputDirectory" in updates and updates["OutputDirectory"]:
-            get_output_root()
 
-        start_update_check(force=True)
-        return jsonify({"status": "ok"})
+def _usage_snapshot(raw: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    raw = raw or {}
+    return {
+        "prompt_tokens": int(raw.get("prompt_tokens", 0) or 0),
+        "completion_tokens": int(raw.get("completion_tokens", 0) or 0),
+    }
 
-    @app.post("/api/process")
-    def process_files():
-        topic = (request.form.get("topic") or "").strip()
-        if not topic:
-            return jsonify({"error": "请输入作文题目"}), 400
 
-        uploads = request.files.getlist("files")
-        if not uploads:
-            return jsonify({"error": "请至少选择一张图片"}), 400
-
-        run_id = datetime.now().strftime("%Y%m%d-%H%M%S")
-        output_root = get_output_root()
-        run_dir = _ensure_directory(output_root / run_id)
-
-        saved_files: List[Dict[str, Any]] = []
-        used_names = set()
-        for index, upload in enumerate(uploads):
-            original_name = upload.filename or f"upload_{index + 1}.png"
-            safe_name = secure_filename(original_name) or f"upload_{index + 1}.png"
-            if safe_name in used_names:
-                stem = Path(safe_name).stem
-                suffix = Path(safe_name).suffix or ".png"
-                counter = 1
-                candidate = f"{stem}_{counter}{suffix}"
-                while candidate in used_names:
-                    counter += 1
-                    candidate = f"{stem}_{counter}{suffix}"
-                safe_name = candidate
-            used_names.add(safe_name)
-
-            saved_path = run_dir / safe_name
-            upload.save(saved_path)
-            saved_files.append(
-                {
-                    "index": index,
-                    "original": original_name,
-                    "name": safe_name,
-                    "path": saved_path,
-                }
-            )
-
-        try:
-            max_workers = int(config_manager.get("MaxWorkers", 4)) or 1
-        except (TypeError, ValueError):
-            max_workers = 4
-
-        save_markdown = _as_bool(config_manager.get("SaveMarkdown", True), True)
-        run_path = relative_to_output(run_dir)
-
-        run_state = {
-            "run_id": run_id,
-            "status": "queued",
-            "total": len(saved_files),
-            "completed": 0,
-            "aggregate": {"vlm_in": 0, "vlm_out": 0, "llm_in": 0, "llm_out": 0},
-            "results": {},
-            "errors": [],
-            "run_path": run_path,
-            "created_at": datetime.now().isoformat(timespec="seconds"),
-        }
-
-        with run_states_lock:
-            run_states[run_id] = run_state
-
-        worker = threading.Thread(
-            target=_execute_run,
-            args=(run_id, saved_files, topic, run_dir, max_workers, save_markdown),
-            daemon=True,
-        )
-        worker.start()
-
-        return jsonify(
-            {
-                "status": "queued",
-                "run_id": run_id,
-                "total": len(saved_files),
-                "run_path": run_path,
-            }
-        )
-
-    @app.get("/api/run-status/<run_id>")
-    def run_status(run_id: str):
-        with run_states_lock:
-            state = run_states.get(run_id)
-            if not state:
-                abort(404)
-
-            results_dict = state.get("results", {})
-            results = [results_dict[index] for index in sorted(results_dict.keys())]
-            aggregate = dict(state.get("aggregate", {"vlm_in": 0, "vlm_out": 0, "llm_in": 0, "llm_out": 0}))
-
-            response = {
-                "run_id": run_id,
-                "status": state.get("status", "unknown"),
-                "total": state.get("total", 0),
-                "completed": state.get("completed", 0),
-                "aggregate": aggregate,
-                "results": results,
-                "run_path": state.get("run_path"),
-                "error": state.get("error"),
-                "errors": state.get("errors", []),
-            }
-
-        return jsonify(response)
-
-    @app.get("/outputs/<path:requested_path>")
-    def serve_outputs(requested_path: str):
-        output_root = get_output_root().resolve()
-        target_path = (output_root / requested_path).resolve()
-        try:
-            target_path.relative_to(output_root)
-        except ValueError:
-            abort(404)
-        if not target_path.exists() or target_path.is_dir():
-            abort(404)
-        relative = target_path.relative_to(output_root).as_posix()
-        return send_from_directory(str(output_root), relative)
-
-    @app.get("/api/update-status")
-    def update_status():
-        with update_lock:
-            return jsonify(
-                {
-                    "current": CURRENT_VERSION,
-                    "latest": update_state["latest"],
-                    "checked": update_state["checked"],
-                }
-            )
-
-    @app.post("/api/update-check")
-    def trigger_update_check():
-        start_update_check(force=True)
-        return jsonify({"status": "checking"})
-
-    @app.get("/")
-    def index():
-        html = '''
-        <!DOCTYPE html>
-        <html lang="zh-CN">
-        <head>
-            <meta charset="UTF-8" />
-            <meta name="viewport" content="width=device-width, initial-scale=1" />
-            <title>AI 作文批改助手 · Web</title>
-            <style>
+# Web界面样式，作为独立静态资源提供，文件名带内容哈希，浏览器可长期缓存。
+INDEX_STYLE = '''
                 :root {
                     color-scheme: light;
                     --glass-bg: rgba(255, 255, 255, 0.28);
@@ -726,6 +369,9 @@ def create_app(config_manager: ConfigManager) -> Flask:
                     border: 1px solid rgba(255, 255, 255, 0.45);
                     display: grid;
                     gap: 12px;
+                    /* 大批量任务时由浏览器跳过视口外卡片的布局与绘制，滚动条高度按估算值占位 */
+                    content-visibility: auto;
+                    contain-intrinsic-size: auto 180px;
                 }
                 .result-card.error {
                     border-color: rgba(255, 99, 132, 0.45);
@@ -757,6 +403,9 @@ def create_app(config_manager: ConfigManager) -> Flask:
                     color: rgba(16, 20, 24, 0.7);
                     line-height: 1.5;
                 }
+                .draft-report {
+                    white-space: pre-wrap;
+                }
                 .banner {
                     display: flex;
                     gap: 12px;
@@ -801,6 +450,7 @@ def create_app(config_manager: ConfigManager) -> Flask:
                     transform: translateY(12px);
                     pointer-events: none;
                     transition: opacity 0.2s ease, transform 0.2s ease;
+                    will-change: opacity, transform;
                 }
                 #toast.show {
                     opacity: 1;
@@ -821,148 +471,11 @@ def create_app(config_manager: ConfigManager) -> Flask:
                         flex: 1 1 120px;
                     }
                 }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="top-bar">
-                    <div class="title-block">
-                        <h1>AI 作文批改助手 · Web</h1>
-                        <p id="version-info">版本 {{ current_version }}</p>
-                    </div>
-                    <div class="pill" id="usage-pill">加载用量中...</div>
-                </div>
-
-                <div class="nav">
-                    <button class="nav-btn active" data-view="grading">批改作文</button>
-                    <button class="nav-btn" data-view="settings">服务设置</button>
-                    <button class="nav-btn" data-view="about">关于</button>
-                </div>
-
-                <div class="view active" data-view-section="grading">
-                    <div class="section">
-                        <h2>批改任务</h2>
-                        <form id="process-form" enctype="multipart/form-data">
-                            <label>作文题目 / 场景说明
-                                <textarea name="topic" placeholder="请粘贴题目或场景描述"></textarea>
-                            </label>
-                            <label>上传作文照片 (支持多选)
-                                <input type="file" name="files" accept="image/*" multiple />
-                            </label>
-                            <div class="actions">
-                                <button type="submit" id="start-process">开始批改</button>
-                            </div>
-                        </form>
-                        <div id="process-status"></div>
-                    </div>
-
-                    <div class="section">
-                        <h2>批改结果</h2>
-                        <div id="results" class="results">
-                            <div class="banner">暂时没有任务，上传图片后将显示处理结果。</div>
-                        </div>
-                    </div>
-                </div>
+'''
 
-                <div class="view" data-view-section="settings">
-                    <div class="section">
-                        <h2>服务设置</h2>
-                        <form id="settings-form">
-                            <div class="grid-2">
-                                <label>VLM URL
-                                    <input type="text" name="vlm_url" autocomplete="off" />
-                                </label>
-                                <label>VLM API Key
-                                    <input type="text" name="vlm_api_key" autocomplete="off" />
-                                </label>
-                                <label>VLM 模型
-                                    <input type="text" name="vlm_model" autocomplete="off" />
-                                </label>
-                                <label>VLM 温度 (0-2)
-                                    <input type="number" name="vlm_temperature" min="0" max="2" step="0.1" />
-                                </label>
-                                <label>LLM URL
-                                    <input type="text" name="llm_url" autocomplete="off" />
-                                </label>
-                                <label>LLM API Key
-                                    <input type="text" name="llm_api_key" autocomplete="off" />
-                                </label>
-                                <label>LLM 模型
-                                    <input type="text" name="llm_model" autocomplete="off" />
-                                </label>
-                                <label>LLM 温度 (0-2)
-                                    <input type="number" name="llm_temperature" min="0" max="2" step="0.1" />
-                                </label>
-                                <label>手写敏感度 (建议 1.0)
-                                    <input type="text" name="sensitivity_factor" autocomplete="off" />
-                                </label>
-                                <label>最大并发数
-                                    <input type="number" name="max_workers" min="1" />
-                                </label>
-                                <label>最大重试次数
-                                    <input type="number" name="max_retries" min="1" />
-                                </label>
-                                <label>重试延迟 (秒)
-                                    <input type="number" name="retry_delay" min="1" />
-                                </label>
-                                <label>请求超时时间 (秒)
-                                    <input type="number" name="request_timeout" min="1" step="1" />
-                                </label>
-                                <label>输出目录
-                                    <input type="text" name="output_directory" autocomplete="off" />
-                                </label>
-                            </div>
-                            <div class="grid-2">
-                                <label class="checkbox-row"><input type="checkbox" name="save_markdown" />保存 Markdown</label>
-                                <label class="checkbox-row"><input type="checkbox" name="render_markdown" />渲染 HTML 报告</label>
-                                <label class="checkbox-row"><input type="checkbox" name="auto_update_check" />启动时检查更新</label>
-                            </div>
-                            <label>LLM Prompt 模板
-                                <textarea name="llm_prompt" spellcheck="false"></textarea>
-                            </label>
-                            <div class="actions">
-                                <button type="submit" id="save-settings">保存设置</button>
-                                <button type="button" id="reset-template" class="ghost-btn">恢复默认模板</button>
-                            </div>
-                        </form>
-                    </div>
-                </div>
 
-                <div class="view" data-view-section="about">
-                    <div class="section">
-                        <h2>关于与更新</h2>
-                        <div class="about-card">
-                            <h3>AI 作文批改助手</h3>
-                            <p>一款专注于英语作文批改的 Web 应用，整合视觉语言模型（VLM）与大语言模型（LLM），帮助教师与学生高效获得结构化反馈。</p>
-                            <ul>
-                                <li>两阶段流水线：先识别手写文本与书写分，再生成全中文批改报告。</li>
-                                <li>任务分离：所有图片自动归档到独立 run id，方便回溯、分享与比对。</li>
-                                <li>Prompt 可编辑：浏览器内直接替换评分模板，快速适配不同考试场景。</li>
-                                <li>安全可控：API Key 本地加密保存，Token 用量实时累计并在界面呈现。</li>
-                            </ul>
-                            <p class="muted">作者：Eric_Terminal · 项目主页：<a href="https://github.com/Eric-Terminal/Pro_llm_correct" target="_blank" rel="noopener">GitHub</a></p>
-                        </div>
-                        <div class="about-card">
-                            <div><strong>当前版本：</strong><span id="about-current">{{ current_version }}</span></div>
-                            <div id="about-latest">正在获取最新版本信息...</div>
-                            <div id="about-checked" class="muted"></div>
-                            <div class="actions">
-                                <button class="ghost-btn" id="check-updates">检查更新</button>
-                            </div>
-                        </div>
-                        <div class="about-card">
-                            <strong>使用提示</strong>
-                            <ul>
-                                <li>默认使用 <code>output_reports/时间戳</code> 保存批改文件，可在设置中修改。</li>
-                                <li>可单独保存 Markdown 或 HTML，也可保留二者。</li>
-                                <li>Prompt 模板支持完全自定义，请保留参数占位符以确保正常传值。</li>
-                            </ul>
-                        </div>
-                    </div>
-                </div>
-            </div>
-            <div id="toast"></div>
-            <script>
+# Web界面脚本（Jinja2），仅包含默认输出目录一个变量；渲染后同样以带哈希的文件名提供。
+INDEX_SCRIPT = '''
                 const navButtons = document.querySelectorAll('.nav-btn');
                 const views = document.querySelectorAll('[data-view-section]');
                 const settingsForm = document.getElementById('settings-form');
@@ -970,6 +483,7 @@ def create_app(config_manager: ConfigManager) -> Flask:
                 const fileInput = processForm.querySelector('input[name="files"]');
                 const startButton = document.getElementById('start-process');
                 const resultsPanel = document.getElementById('results');
+                const cardTemplate = document.getElementById('card-tpl');
                 const statusBox = document.getElementById('process-status');
                 const toast = document.getElementById('toast');
                 const usagePill = document.getElementById('usage-pill');
@@ -979,8 +493,37 @@ def create_app(config_manager: ConfigManager) -> Flask:
                 const aboutCurrent = document.getElementById('about-current');
                 const aboutLatest = document.getElementById('about-latest');
                 const aboutChecked = document.getElementById('about-checked');
+                // 自适应轮询：进度有变化时保持最短间隔，空闲时逐步放缓到上限
+                const POLL_MIN_INTERVAL = 400;
+                const POLL_MAX_INTERVAL = 3000;
                 let pollTimer = null;
+                // 支持 EventSource 时由服务器推送任务状态，连接失败再退回轮询
+                let runStream = null;
+                let pollDelay = POLL_MIN_INTERVAL;
+                let lastCompleted = -1;
                 let currentRunId = null;
+                // 同一帧内到达的多次状态更新合并为一次渲染
+                let pendingRender = null;
+                let renderFrame = 0;
+                // Prompt 模板体积较大且只在设置页可见，首次打开设置页时才加载
+                let promptLoaded = false;
+                let defaultPromptTemplate = '';
+                // 同一地址的 GET 请求返回前只发出一次，并发调用方共享解析后的 JSON
+                const inflightRequests = new Map();
+
+                function fetchJsonShared(url) {
+                    let pending = inflightRequests.get(url);
+                    if (!pending) {
+                        pending = fetch(url)
+                            .then(async (res) => {
+                                if (!res.ok) throw new Error(await res.text());
+                                return res.json();
+                            })
+                            .finally(() => inflightRequests.delete(url));
+                        inflightRequests.set(url, pending);
+                    }
+                    return pending;
+                }
 
                 function switchView(view) {
                     views.forEach((section) => {
@@ -989,6 +532,23 @@ def create_app(config_manager: ConfigManager) -> Flask:
                     navButtons.forEach((btn) => {
                         btn.classList.toggle('active', btn.dataset.view === view);
                     });
+                    if (view === 'settings' && !promptLoaded) {
+                        loadPromptTemplate();
+                    }
+                }
+
+                async function loadPromptTemplate() {
+                    try {
+                        const res = await fetch('/api/prompt-template');
+                        if (!res.ok) throw new Error(await res.text());
+                        const data = await res.json();
+                        settingsForm.llm_prompt.value = data.LlmPromptTemplate || '';
+                        defaultPromptTemplate = data.DefaultTemplate || '';
+                        promptLoaded = true;
+                    } catch (err) {
+                        console.error(err);
+                        showToast('加载 Prompt 模板失败', 'error');
+                    }
                 }
 
                 navButtons.forEach((btn) => {
@@ -1010,9 +570,18 @@ def create_app(config_manager: ConfigManager) -> Flask:
 
                 function stopPolling() {
                     if (pollTimer) {
-                        clearInterval(pollTimer);
+                        clearTimeout(pollTimer);
                         pollTimer = null;
                     }
+                    if (runStream) {
+                        runStream.close();
+                        runStream = null;
+                    }
+                }
+
+                function scheduleNextPoll(progressed) {
+                    pollDelay = progressed ? POLL_MIN_INTERVAL : Math.min(Math.round(pollDelay * 1.6), POLL_MAX_INTERVAL);
+                    pollTimer = setTimeout(pollRunStatus, pollDelay);
                 }
 
                 function updateAboutInfo(data) {
@@ -1027,51 +596,54 @@ def create_app(config_manager: ConfigManager) -> Flask:
                     aboutChecked.textContent = data.CheckedAt ? `最近检查：${data.CheckedAt}` : '';
                 }
 
+                // 设置表单字段与配置键的对应关系：[表单字段名, 配置键, 类型, 默认值]
+                // text：去除首尾空白后提交；number：原样提交；check：复选框；
+                // secret：不回填已保存的值，留空表示沿用（Has<配置键> 指示是否已保存）
+                const SETTINGS_FIELDS = [
+                    ['vlm_url', 'VlmUrl', 'text', ''],
+                    ['vlm_api_key', 'VlmApiKey', 'secret', ''],
+                    ['vlm_model', 'VlmModel', 'text', ''],
+                    ['vlm_temperature', 'VlmTemperature', 'number', 0],
+                    ['llm_url', 'LlmUrl', 'text', ''],
+                    ['llm_api_key', 'LlmApiKey', 'secret', ''],
+                    ['llm_model', 'LlmModel', 'text', ''],
+                    ['llm_temperature', 'LlmTemperature', 'number', 0],
+                    ['sensitivity_factor', 'SensitivityFactor', 'text', ''],
+                    ['max_workers', 'MaxWorkers', 'number', 4],
+                    ['max_retries', 'MaxRetries', 'number', 3],
+                    ['retry_delay', 'RetryDelay', 'number', 5],
+                    ['request_timeout', 'RequestTimeout', 'number', 120],
+                    ['output_directory', 'OutputDirectory', 'text', '{{ default_output_dir }}'],
+                    ['save_markdown', 'SaveMarkdown', 'check', false],
+                    ['render_markdown', 'RenderMarkdown', 'check', false],
+                    ['auto_update_check', 'AutoUpdateCheck', 'check', false],
+                ];
+
                 function populateConfig(data) {
-                    settingsForm.vlm_url.value = data.VlmUrl || '';
-                    settingsForm.vlm_api_key.value = '';
-                    settingsForm.vlm_model.value = data.VlmModel || '';
-                    settingsForm.vlm_temperature.value = data.VlmTemperature ?? 0;
-                    settingsForm.llm_url.value = data.LlmUrl || '';
-                    settingsForm.llm_api_key.value = '';
-                    settingsForm.llm_model.value = data.LlmModel || '';
-                    settingsForm.llm_temperature.value = data.LlmTemperature ?? 0;
-                    settingsForm.sensitivity_factor.value = data.SensitivityFactor || '';
-                    settingsForm.max_workers.value = data.MaxWorkers || 4;
-                    settingsForm.max_retries.value = data.MaxRetries || 3;
-                    settingsForm.retry_delay.value = data.RetryDelay || 5;
-                    settingsForm.request_timeout.value = data.RequestTimeout ?? 120;
-                    settingsForm.output_directory.value = data.OutputDirectory || '{{ default_output_dir }}';
-                    settingsForm.save_markdown.checked = !!data.SaveMarkdown;
-                    settingsForm.render_markdown.checked = !!data.RenderMarkdown;
-                    settingsForm.auto_update_check.checked = !!data.AutoUpdateCheck;
-                    settingsForm.llm_prompt.value = data.LlmPromptTemplate || '';
+                    SETTINGS_FIELDS.forEach(([name, key, type, fallback]) => {
+                        const field = settingsForm[name];
+                        if (type === 'check') {
+                            field.checked = !!data[key];
+                        } else if (type === 'secret') {
+                            field.value = '';
+                            if (data[`Has${key}`]) {
+                                field.placeholder = '已保存 · 输入新密钥以更新';
+                                field.dataset.saved = 'true';
+                                field.title = '已保存，留空保持不变';
+                            } else {
+                                field.placeholder = '';
+                                delete field.dataset.saved;
+                                field.removeAttribute('title');
+                            }
+                        } else if (type === 'number') {
+                            field.value = data[key] ?? fallback;
+                        } else {
+                            field.value = String(data[key] ?? '') || fallback;
+                        }
+                    });
 
                     usagePill.textContent = `VLM ${data.Usage.vlm_input}/${data.Usage.vlm_output} · LLM ${data.Usage.llm_input}/${data.Usage.llm_output}`;
 
-                    const hasVlmKey = !!data.HasVlmApiKey;
-                    const hasLlmKey = !!data.HasLlmApiKey;
-
-                    if (hasVlmKey) {
-                        settingsForm.vlm_api_key.placeholder = '已保存 · 输入新密钥以更新';
-                        settingsForm.vlm_api_key.dataset.saved = 'true';
-                        settingsForm.vlm_api_key.title = '已保存，留空保持不变';
-                    } else {
-                        settingsForm.vlm_api_key.placeholder = '';
-                        delete settingsForm.vlm_api_key.dataset.saved;
-                        settingsForm.vlm_api_key.removeAttribute('title');
-                    }
-
-                    if (hasLlmKey) {
-                        settingsForm.llm_api_key.placeholder = '已保存 · 输入新密钥以更新';
-                        settingsForm.llm_api_key.dataset.saved = 'true';
-                        settingsForm.llm_api_key.title = '已保存，留空保持不变';
-                    } else {
-                        settingsForm.llm_api_key.placeholder = '';
-                        delete settingsForm.llm_api_key.dataset.saved;
-                        settingsForm.llm_api_key.removeAttribute('title');
-                    }
-
                     if (data.LatestVersion && data.LatestVersion !== data.CurrentVersion) {
                         versionInfo.textContent = `版本 ${data.CurrentVersion} · 发现新版本 ${data.LatestVersion}`;
                     } else {
@@ -1082,9 +654,8 @@ def create_app(config_manager: ConfigManager) -> Flask:
 
                 async function loadConfig() {
                     try {
-                        const res = await fetch('/api/config');
-                        if (!res.ok) throw new Error(await res.text());
-                        const data = await res.json();
+                        // 与页面 preload 的地址一致，首次加载直接复用预取的响应
+                        const data = await fetchJsonShared('/api/config?prompt=0');
                         populateConfig(data);
                     } catch (err) {
                         console.error(err);
@@ -1094,26 +665,20 @@ def create_app(config_manager: ConfigManager) -> Flask:
 
                 settingsForm.addEventListener('submit', async (event) => {
                     event.preventDefault();
-                    const payload = {
-                        VlmUrl: settingsForm.vlm_url.value.trim(),
-                        VlmApiKey: settingsForm.vlm_api_key.value.trim(),
-                        VlmModel: settingsForm.vlm_model.value.trim(),
-                        VlmTemperature: settingsForm.vlm_temperature.value,
-                        LlmUrl: settingsForm.llm_url.value.trim(),
-                        LlmApiKey: settingsForm.llm_api_key.value.trim(),
-                        LlmModel: settingsForm.llm_model.value.trim(),
-                        LlmTemperature: settingsForm.llm_temperature.value,
-                        SensitivityFactor: settingsForm.sensitivity_factor.value.trim(),
-                        MaxWorkers: settingsForm.max_workers.value,
-                        MaxRetries: settingsForm.max_retries.value,
-                        RetryDelay: settingsForm.retry_delay.value,
-                        RequestTimeout: settingsForm.request_timeout.value,
-                        OutputDirectory: settingsForm.output_directory.value.trim(),
-                        SaveMarkdown: settingsForm.save_markdown.checked,
-                        RenderMarkdown: settingsForm.render_markdown.checked,
-                        AutoUpdateCheck: settingsForm.auto_update_check.checked,
-                        LlmPromptTemplate: settingsForm.llm_prompt.value,
-                    };
+                    const payload = {};
+                    SETTINGS_FIELDS.forEach(([name, key, type]) => {
+                        const field = settingsForm[name];
+                        if (type === 'check') {
+                            payload[key] = field.checked;
+                        } else if (type === 'number') {
+                            payload[key] = field.value;
+                        } else {
+                            payload[key] = field.value.trim();
+                        }
+                    });
+                    if (promptLoaded) {
+                        payload.LlmPromptTemplate = settingsForm.llm_prompt.value;
+                    }
                     try {
                         const res = await fetch('/api/config', {
                             method: 'POST',
@@ -1125,6 +690,8 @@ def create_app(config_manager: ConfigManager) -> Flask:
                             throw new Error(data.error || '保存失败');
                         }
                         showToast('设置已保存', 'success');
+                        // 保存前发出的读取可能返回旧配置，不与之合并
+                        inflightRequests.delete('/api/config?prompt=0');
                         loadConfig();
                     } catch (err) {
                         showToast(err.message, 'error');
@@ -1132,18 +699,17 @@ def create_app(config_manager: ConfigManager) -> Flask:
                 });
 
                 resetTemplateBtn.addEventListener('click', () => {
-                    fetch('/api/config')
-                        .then((res) => res.json())
-                        .then((data) => {
-                            settingsForm.llm_prompt.value = data.LlmPromptTemplate;
-                            showToast('已恢复默认模板');
-                        })
-                        .catch(() => showToast('恢复失败', 'error'));
+                    if (!promptLoaded) {
+                        showToast('恢复失败', 'error');
+                        return;
+                    }
+                    settingsForm.llm_prompt.value = defaultPromptTemplate;
+                    showToast('已恢复默认模板');
                 });
 
                 processForm.addEventListener('submit', async (event) => {
                     event.preventDefault();
-                    if (pollTimer) {
+                    if (currentRunId) {
                         showToast('上一个任务仍在进行，请稍候', 'error');
                         return;
                     }
@@ -1171,6 +737,9 @@ def create_app(config_manager: ConfigManager) -> Flask:
                         if (!res.ok) {
                             startButton.disabled = false;
                             const data = await res.json().catch(() => ({}));
+                            if (data.missing) {
+                                switchView('settings');
+                            }
                             throw new Error(data.error || '处理失败');
                         }
 
@@ -1181,7 +750,7 @@ def create_app(config_manager: ConfigManager) -> Flask:
                         }
 
                         statusBox.textContent = `正在批改：已完成 0 / ${data.total || 0}`;
-                        renderResults({
+                        scheduleRender({
                             status: 'queued',
                             total: data.total || 0,
                             completed: 0,
@@ -1200,8 +769,24 @@ def create_app(config_manager: ConfigManager) -> Flask:
                 function startPolling(runId) {
                     currentRunId = runId;
                     stopPolling();
-                    pollRunStatus();
-                    pollTimer = setInterval(pollRunStatus, 1500);
+                    pollDelay = POLL_MIN_INTERVAL;
+                    lastCompleted = -1;
+                    if (window.EventSource) {
+                        runStream = new EventSource(`/api/run-stream/${runId}`);
+                        runStream.onmessage = (event) => handleRunStatus(JSON.parse(event.data));
+                        runStream.onerror = () => {
+                            if (!runStream) {
+                                return;
+                            }
+                            runStream.close();
+                            runStream = null;
+                            if (currentRunId === runId) {
+                                pollTimer = setTimeout(pollRunStatus, 0);
+                            }
+                        };
+                        return;
+                    }
+                    pollTimer = setTimeout(pollRunStatus, 0);
                 }
 
                 async function pollRunStatus() {
@@ -1209,41 +794,13 @@ def create_app(config_manager: ConfigManager) -> Flask:
                         return;
                     }
                     try {
-                        const res = await fetch(`/api/run-status/${currentRunId}`);
+                        // 只请求上次之后完成的结果，已渲染的卡片不重复传输
+                        const since = Math.max(lastCompleted, 0);
+                        const res = await fetch(`/api/run-status/${currentRunId}?since=${since}`);
                         if (!res.ok) {
                             throw new Error(await res.text());
                         }
-                        const data = await res.json();
-                        const total = data.total || 0;
-                        const completed = data.completed || 0;
-
-                        if (data.status === 'queued' || data.status === 'running') {
-                            statusBox.textContent = `正在批改：已完成 ${completed} / ${total}`;
-                            renderResults(data);
-                        } else {
-                            stopPolling();
-                            currentRunId = null;
-                            startButton.disabled = false;
-
-                            if (data.status === 'ok') {
-                                statusBox.textContent = '任务完成';
-                                showToast('任务完成', 'success');
-                            } else if (data.status === 'partial') {
-                                statusBox.textContent = '任务部分失败';
-                                showToast('部分文件处理失败', 'error');
-                            } else if (data.status === 'failed') {
-                                statusBox.textContent = '任务失败';
-                                showToast(data.error || '任务失败', 'error');
-                            } else if (data.status === 'empty') {
-                                statusBox.textContent = '无可处理的文件';
-                                showToast('没有可处理的文件', 'info');
-                            } else {
-                                statusBox.textContent = '任务完成';
-                            }
-
-                            renderResults(data);
-                            loadConfig();
-                        }
+                        handleRunStatus(await res.json());
                     } catch (err) {
                         console.error(err);
                         showToast('获取进度失败', 'error');
@@ -1253,6 +810,135 @@ def create_app(config_manager: ConfigManager) -> Flask:
                     }
                 }
 
+                function handleRunStatus(data) {
+                    const total = data.total || 0;
+                    const completed = data.completed || 0;
+
+                    if (data.status === 'queued' || data.status === 'running') {
+                        // 仅在进度变化或有报告正在生成时更新页面，空闲轮询不触发重绘
+                        const generating = Object.keys(data.streaming || {}).length > 0;
+                        const progressed = completed !== lastCompleted || generating;
+                        if (progressed) {
+                            statusBox.textContent = `正在批改：已完成 ${completed} / ${total}`;
+                            scheduleRender(data);
+                        }
+                        lastCompleted = completed;
+                        if (!runStream) {
+                            scheduleNextPoll(progressed);
+                        }
+                    } else {
+                        stopPolling();
+                        currentRunId = null;
+                        startButton.disabled = false;
+
+                        if (data.status === 'ok') {
+                            statusBox.textContent = '任务完成';
+                            showToast('任务完成', 'success');
+                        } else if (data.status === 'partial') {
+                            statusBox.textContent = '任务部分失败';
+                            showToast('部分文件处理失败', 'error');
+                        } else if (data.status === 'failed') {
+                            statusBox.textContent = '任务失败';
+                            showToast(data.error || '任务失败', 'error');
+                        } else if (data.status === 'empty') {
+                            statusBox.textContent = '无可处理的文件';
+                            showToast('没有可处理的文件', 'info');
+                        } else {
+                            statusBox.textContent = '任务完成';
+                        }
+
+                        scheduleRender(data);
+                        loadConfig();
+                    }
+                }
+
+                function scheduleRender(data) {
+                    // 服务器每次只返回新增结果，同一任务尚未渲染的更新需累积结果而非直接覆盖
+                    if (pendingRender && pendingRender.run_id === data.run_id) {
+                        data = { ...data, results: [...(pendingRender.results || []), ...(data.results || [])] };
+                    }
+                    pendingRender = data;
+                    if (!renderFrame) {
+                        renderFrame = requestAnimationFrame(() => {
+                            const next = pendingRender;
+                            renderFrame = 0;
+                            pendingRender = null;
+                            renderResults(next);
+                        });
+                    }
+                }
+
+                function renderResultCard(item) {
+                    // 克隆已解析好的卡片结构，只填充变化的字段；文件名、日志与错误以 textContent 写入，不经过 HTML 解析
+                    const card = cardTemplate.content.firstElementChild.cloneNode(true);
+                    const field = (name) => card.querySelector(`[data-field="${name}"]`);
+                    card.classList.add(item.error ? 'error' : 'success');
+                    card.dataset.index = item.index;
+                    field('original').textContent = item.original;
+                    field('usage').textContent = `VLM ${item.vlm_usage.prompt_tokens}/${item.vlm_usage.completion_tokens} · LLM ${item.llm_usage.prompt_tokens}/${item.llm_usage.completion_tokens}`;
+
+                    const links = field('links');
+                    [['saved', '原图'], ['markdown', 'Markdown'], ['html', 'HTML']].forEach(([key, label]) => {
+                        if (!item[key]) {
+                            return;
+                        }
+                        const link = document.createElement('a');
+                        link.href = `/outputs/${item[key]}`;
+                        link.target = '_blank';
+                        link.textContent = label;
+                        links.appendChild(link);
+                    });
+
+                    const logs = field('logs');
+                    if (item.error) {
+                        const error = document.createElement('strong');
+                        error.style.color = '#d93025';
+                        error.textContent = item.error;
+                        logs.appendChild(error);
+                    }
+                    (item.logs || []).forEach((log) => {
+                        const line = document.createElement('div');
+                        line.textContent = `• ${log}`;
+                        logs.appendChild(line);
+                    });
+                    return card;
+                }
+
+                function renderDraftCard(index, original) {
+                    // 报告生成期间的草稿卡片，文件完成后由正式卡片替换
+                    const card = cardTemplate.content.firstElementChild.cloneNode(true);
+                    card.dataset.index = index;
+                    card.querySelector('[data-field="original"]').textContent = original;
+                    card.querySelector('[data-field="usage"]').textContent = '正在生成批改报告...';
+                    const body = document.createElement('div');
+                    body.className = 'draft-report';
+                    card.querySelector('[data-field="logs"]').appendChild(body);
+                    return { card, body, text: '' };
+                }
+
+                function insertCards(cardsBox, cards) {
+                    // cards 按序号升序；排在已有卡片之后的部分先收集到 DocumentFragment，最后一次性追加
+                    const tail = document.createDocumentFragment();
+                    cards.forEach((card) => {
+                        const index = Number(card.dataset.index);
+                        // 保持按文件序号排列：插入到第一个序号更大的卡片之前
+                        const next = Array.from(cardsBox.children).find((existing) => Number(existing.dataset.index) > index);
+                        if (next) {
+                            cardsBox.insertBefore(card, next);
+                        } else {
+                            tail.appendChild(card);
+                        }
+                    });
+                    if (tail.childNodes.length) {
+                        cardsBox.appendChild(tail);
+                    }
+                }
+
+                // 结果卡片一经生成便不再变化，只追加新完成的卡片，单次刷新开销与批量大小无关
+                let renderedRunId = null;
+                let renderedIndexes = new Set();
+                let draftCards = new Map();
+
                 function renderResults(data) {
                     const status = data.status || 'running';
                     const total = data.total || 0;
@@ -1271,53 +957,79 @@ def create_app(config_manager: ConfigManager) -> Flask:
                     const summary = `${statusMap[status] || status} · 已完成 ${completed}/${total}${locationNote}`;
                     const aggLine = `合计 | VLM ${aggregate.vlm_in || 0}/${aggregate.vlm_out || 0} · LLM ${aggregate.llm_in || 0}/${aggregate.llm_out || 0}`;
 
-                    let content = `<div class="banner">${summary}</div><div class="banner">${aggLine}</div>`;
+                    let summaryBox = resultsPanel.querySelector('.result-summary');
+                    let cardsBox = resultsPanel.querySelector('.result-cards');
+                    if (!summaryBox || !cardsBox || data.run_id !== renderedRunId) {
+                        resultsPanel.innerHTML = '<div class="result-summary"><div class="banner"></div><div class="banner"></div><div class="banner">暂无结果，请稍候...</div></div><div class="result-cards"></div>';
+                        summaryBox = resultsPanel.querySelector('.result-summary');
+                        cardsBox = resultsPanel.querySelector('.result-cards');
+                        renderedRunId = data.run_id;
+                        renderedIndexes = new Set();
+                        draftCards = new Map();
+                    }
 
-                    if (!results.length) {
-                        content += '<div class="banner">暂无结果，请稍候...</div>';
-                        resultsPanel.innerHTML = content;
-                        return;
+                    // 摘要区的节点保持不变，只在文字变化时更新 textContent
+                    const [statusBanner, aggBanner, emptyBanner] = summaryBox.children;
+                    if (statusBanner.textContent !== summary) {
+                        statusBanner.textContent = summary;
+                    }
+                    if (aggBanner.textContent !== aggLine) {
+                        aggBanner.textContent = aggLine;
                     }
 
-                    const cards = results
-                        .map((item) => {
-                            const statusClass = item.error ? 'result-card error' : 'result-card success';
-                            const links = [];
-                            if (item.saved) {
-                                links.push(`<a href="/outputs/${item.saved}" target="_blank">原图</a>`);
-                            }
-                            if (item.markdown) {
-                                links.push(`<a href="/outputs/${item.markdown}" target="_blank">Markdown</a>`);
-                            }
-                            if (item.html) {
-                                links.push(`<a href="/outputs/${item.html}" target="_blank">HTML</a>`);
+                    const newCards = [];
+                    results.forEach((item) => {
+                        if (renderedIndexes.has(item.index)) {
+                            return;
+                        }
+                        renderedIndexes.add(item.index);
+                        const card = renderResultCard(item);
+                        const draft = draftCards.get(item.index);
+                        if (draft) {
+                            draftCards.delete(item.index);
+                            draft.card.replaceWith(card);
+                        } else {
+                            newCards.push(card);
+                        }
+                    });
+                    insertCards(cardsBox, newCards);
+
+                    // 生成中的报告：服务器每次发送累计文本，只把新增部分作为文本节点追加，已显示的内容不重新解析
+                    const newDrafts = [];
+                    Object.entries(data.streaming || {}).forEach(([key, entry]) => {
+                        const index = Number(key);
+                        if (renderedIndexes.has(index)) {
+                            return;
+                        }
+                        let draft = draftCards.get(index);
+                        if (!draft) {
+                            draft = renderDraftCard(index, entry.original);
+                            draftCards.set(index, draft);
+                            newDrafts.push(draft.card);
+                        }
+                        if (entry.text.startsWith(draft.text)) {
+                            if (entry.text.length > draft.text.length) {
+                                draft.body.appendChild(document.createTextNode(entry.text.slice(draft.text.length)));
                             }
-                            const usage = `VLM ${item.vlm_usage.prompt_tokens}/${item.vlm_usage.completion_tokens} · LLM ${item.llm_usage.prompt_tokens}/${item.llm_usage.completion_tokens}`;
-                            const logLines = (item.logs || []).map((log) => `<div>• ${log}</div>`).join('');
-                            const errorBlock = item.error ? `<strong style="color:#d93025;">${item.error}</strong>` : '';
-                            return `
-                                <div class="${statusClass}">
-                                    <div class="result-header">
-                                        <div>
-                                            <strong>${item.original}</strong>
-                                            <div style="font-size:12px;color:rgba(16,20,24,0.55);">${usage}</div>
-                                        </div>
-                                        <div class="result-links">${links.join('')}</div>
-                                    </div>
-                                    <div class="logs">${errorBlock}${logLines}</div>
-                                </div>
-                            `;
-                        })
-                        .join('');
-
-                    resultsPanel.innerHTML = content + cards;
+                        } else {
+                            // 重试后重新生成时整体替换
+                            draft.body.textContent = entry.text;
+                        }
+                        draft.text = entry.text;
+                    });
+                    insertCards(cardsBox, newDrafts);
+                    if (status !== 'queued' && status !== 'running') {
+                        draftCards.forEach((draft) => draft.card.remove());
+                        draftCards.clear();
+                    }
+
+                    // 服务器只返回新增结果，是否为空以已渲染的卡片为准
+                    emptyBanner.style.display = renderedIndexes.size || draftCards.size ? 'none' : '';
                 }
 
                 async function refreshUpdateStatus(showToastOnNew = false) {
                     try {
-                        const res = await fetch('/api/update-status');
-                        if (!res.ok) return;
-                        const data = await res.json();
+                        const data = await fetchJsonShared('/api/update-status');
                         if (data.current) {
                             versionInfo.textContent = `版本 ${data.current}`;
                             aboutCurrent.textContent = data.current;
@@ -1352,16 +1064,917 @@ def create_app(config_manager: ConfigManager) -> Flask:
                 });
 
                 switchView('grading');
-                loadConfig().then(() => refreshUpdateStatus());
-            </script>
+                // 更新检查不影响首屏，等浏览器空闲时再请求，避免与配置加载争用连接
+                const whenIdle = window.requestIdleCallback
+                    ? (callback) => window.requestIdleCallback(callback)
+                    : (callback) => setTimeout(callback, 0);
+                loadConfig().then(() => whenIdle(() => refreshUpdateStatus()));
+'''
+
+
+# Web界面模板（Jinja2），包含版本号以及样式、脚本的资源地址。
+INDEX_TEMPLATE = '''
+        <!DOCTYPE html>
+        <html lang="zh-CN">
+        <head>
+            <meta charset="UTF-8" />
+            <meta name="viewport" content="width=device-width, initial-scale=1" />
+            <title>AI 作文批改助手 · Web</title>
+            <link rel="preload" href="{{ config_url }}" as="fetch" crossorigin />
+            <link rel="stylesheet" href="{{ style_url }}" />
+        </head>
+        <body>
+            <div class="container">
+                <div class="top-bar">
+                    <div class="title-block">
+                        <h1>AI 作文批改助手 · Web</h1>
+                        <p id="version-info">版本 {{ current_version }}</p>
+                    </div>
+                    <div class="pill" id="usage-pill">加载用量中...</div>
+                </div>
+
+                <div class="nav">
+                    <button class="nav-btn active" data-view="grading">批改作文</button>
+                    <button class="nav-btn" data-view="settings">服务设置</button>
+                    <button class="nav-btn" data-view="about">关于</button>
+                </div>
+
+                <div class="view active" data-view-section="grading">
+                    <div class="section">
+                        <h2>批改任务</h2>
+                        <form id="process-form" enctype="multipart/form-data">
+                            <label>作文题目 / 场景说明
+                                <textarea name="topic" placeholder="请粘贴题目或场景描述"></textarea>
+                            </label>
+                            <label>上传作文照片 (支持多选)
+                                <input type="file" name="files" accept="image/*" multiple />
+                            </label>
+                            <div class="actions">
+                                <button type="submit" id="start-process">开始批改</button>
+                            </div>
+                        </form>
+                        <div id="process-status"></div>
+                    </div>
+
+                    <div class="section">
+                        <h2>批改结果</h2>
+                        <div id="results" class="results">
+                            <div class="banner">暂时没有任务，上传图片后将显示处理结果。</div>
+                        </div>
+                    </div>
+                </div>
+
+                <div class="view" data-view-section="settings">
+                    <div class="section">
+                        <h2>服务设置</h2>
+                        <form id="settings-form">
+                            <div class="grid-2">
+                                <label>VLM URL
+                                    <input type="text" name="vlm_url" autocomplete="off" />
+                                </label>
+                                <label>VLM API Key
+                                    <input type="text" name="vlm_api_key" autocomplete="off" />
+                                </label>
+                                <label>VLM 模型
+                                    <input type="text" name="vlm_model" autocomplete="off" />
+                                </label>
+                                <label>VLM 温度 (0-2)
+                                    <input type="number" name="vlm_temperature" min="0" max="2" step="0.1" />
+                                </label>
+                                <label>LLM URL
+                                    <input type="text" name="llm_url" autocomplete="off" />
+                                </label>
+                                <label>LLM API Key
+                                    <input type="text" name="llm_api_key" autocomplete="off" />
+                                </label>
+                                <label>LLM 模型
+                                    <input type="text" name="llm_model" autocomplete="off" />
+                                </label>
+                                <label>LLM 温度 (0-2)
+                                    <input type="number" name="llm_temperature" min="0" max="2" step="0.1" />
+                                </label>
+                                <label>手写敏感度 (建议 1.0)
+                                    <input type="text" name="sensitivity_factor" autocomplete="off" />
+                                </label>
+                                <label>最大并发数
+                                    <input type="number" name="max_workers" min="1" />
+                                </label>
+                                <label>最大重试次数
+                                    <input type="number" name="max_retries" min="1" />
+                                </label>
+                                <label>重试延迟 (秒)
+                                    <input type="number" name="retry_delay" min="1" />
+                                </label>
+                                <label>请求超时时间 (秒)
+                                    <input type="number" name="request_timeout" min="1" step="1" />
+                                </label>
+                                <label>输出目录
+                                    <input type="text" name="output_directory" autocomplete="off" />
+                                </label>
+                            </div>
+                            <div class="grid-2">
+                                <label class="checkbox-row"><input type="checkbox" name="save_markdown" />保存 Markdown</label>
+                                <label class="checkbox-row"><input type="checkbox" name="render_markdown" />渲染 HTML 报告</label>
+                                <label class="checkbox-row"><input type="checkbox" name="auto_update_check" />启动时检查更新</label>
+                            </div>
+                            <label>LLM Prompt 模板
+                                <textarea name="llm_prompt" spellcheck="false"></textarea>
+                            </label>
+                            <div class="actions">
+                                <button type="submit" id="save-settings">保存设置</button>
+                                <button type="button" id="reset-template" class="ghost-btn">恢复默认模板</button>
+                            </div>
+                        </form>
+                    </div>
+                </div>
+
+                <div class="view" data-view-section="about">
+                    <div class="section">
+                        <h2>关于与更新</h2>
+                        <div class="about-card">
+                            <h3>AI 作文批改助手</h3>
+                            <p>一款专注于英语作文批改的 Web 应用，整合视觉语言模型（VLM）与大语言模型（LLM），帮助教师与学生高效获得结构化反馈。</p>
+                            <ul>
+                                <li>两阶段流水线：先识别手写文本与书写分，再生成全中文批改报告。</li>
+                                <li>任务分离：所有图片自动归档到独立 run id，方便回溯、分享与比对。</li>
+                                <li>Prompt 可编辑：浏览器内直接替换评分模板，快速适配不同考试场景。</li>
+                                <li>安全可控：API Key 本地加密保存，Token 用量实时累计并在界面呈现。</li>
+                            </ul>
+                            <p class="muted">作者：Eric_Terminal · 项目主页：<a href="https://github.com/Eric-Terminal/Pro_llm_correct" target="_blank" rel="noopener">GitHub</a></p>
+                        </div>
+                        <div class="about-card">
+                            <div><strong>当前版本：</strong><span id="about-current">{{ current_version }}</span></div>
+                            <div id="about-latest">正在获取最新版本信息...</div>
+                            <div id="about-checked" class="muted"></div>
+                            <div class="actions">
+                                <button class="ghost-btn" id="check-updates">检查更新</button>
+                            </div>
+                        </div>
+                        <div class="about-card">
+                            <strong>使用提示</strong>
+                            <ul>
+                                <li>默认使用 <code>output_reports/时间戳</code> 保存批改文件，可在设置中修改。</li>
+                                <li>可单独保存 Markdown 或 HTML，也可保留二者。</li>
+                                <li>Prompt 模板支持完全自定义，请保留参数占位符以确保正常传值。</li>
+                            </ul>
+                        </div>
+                    </div>
+                </div>
+            </div>
+            <div id="toast"></div>
+            <template id="card-tpl">
+                <div class="result-card">
+                    <div class="result-header">
+                        <div>
+                            <strong data-field="original"></strong>
+                            <div data-field="usage" style="font-size:12px;color:rgba(16,20,24,0.55);"></div>
+                        </div>
+                        <div class="result-links" data-field="links"></div>
+                    </div>
+                    <div class="logs" data-field="logs"></div>
+                </div>
+            </template>
+            <script src="{{ script_url }}" defer></script>
         </body>
         </html>
-        '''
-        return render_template_string(
-            html,
-            current_version=CURRENT_VERSION,
-            default_output_dir=DEFAULT_OUTPUT_DIR_NAME,
-        )
+'''
+
+
+def create_app(config_manager: ConfigManager) -> Flask:
+    """Create and configure the Flask web application."""
+
+    app = Flask(__name__)
+    app.config["MAX_CONTENT_LENGTH"] = 100 * 1024 * 1024  # 100 MB payload ceiling
+    if orjson is not None:
+        app.json = _OrjsonProvider(app)
+    app.logger.handlers.clear()
+    app.logger.propagate = True
+    logger = logging.getLogger("essay_corrector.web")
+
+    api_service = ApiService(config_manager)
+    config_lock = threading.Lock()
+    update_state: Dict[str, Optional[str]] = {"latest": None, "checked": None}
+    update_lock = threading.Lock()
+    # 任务状态采用写时复制：每次更新都构建新字典整体替换，已发布的快照不再修改，
+    # 轮询接口直接读取快照而无需加锁；写入方之间仍由 run_states_lock 串行化
+    run_states: Dict[str, Dict[str, Any]] = {}
+    run_states_lock = threading.Lock()
+    # 任务状态发布新快照时通知 /api/run-stream 的推送连接
+    run_states_changed = threading.Condition(run_states_lock)
+    # 两级流水线：模型调用的并发数由 MaxWorkers 控制（事件循环中的信号量），
+    # 落盘与统计属于短小的磁盘/CPU工作，使用固定大小的线程池，在应用生命周期内复用
+    postprocess_pool = ThreadPoolExecutor(
+        max_workers=min(POSTPROCESS_MAX_WORKERS, os.cpu_count() or 1),
+        thread_name_prefix="essay-worker",
+    )
+    index_cache: Dict[str, Any] = {}
+    # 按 OutputDirectory 配置值缓存已创建并解析为绝对路径的输出目录，修改该设置时清空
+    output_root_cache: Dict[str, Path] = {}
+    # 序列化后的 /api/config 响应，按是否包含Prompt模板分别缓存，由 config_lock 保护
+    config_response_cache: Dict[bool, str] = {}
+    # 解析后的并发数缓存，仅在设置保存时刷新
+    worker_settings = {"max_workers": _parse_max_workers(config_manager.get("MaxWorkers", 4))}
+
+    def get_output_root() -> Path:
+        configured = config_manager.get("OutputDirectory") or ""
+        cached = output_root_cache.get(configured)
+        if cached is not None:
+            return cached
+        base_path = Path(configured) if configured else Path(DEFAULT_OUTPUT_DIR_NAME)
+        if not base_path.is_absolute():
+            base_path = Path.cwd() / base_path
+        root = _ensure_directory(base_path).resolve()
+        output_root_cache[configured] = root
+        return root
+
+    def update_run_state(
+        run_id: str, changes: Callable[[Dict[str, Any]], Dict[str, Any]]
+    ) -> None:
+        """基于当前快照计算变更并发布新的任务状态；任务已被清理时忽略。"""
+        with run_states_lock:
+            state = run_states.get(run_id)
+            if state is not None:
+                # revision 每次发布递增，作为 /api/run-status 的 ETag 依据
+                run_states[run_id] = {**state, **changes(state), "revision": state["revision"] + 1}
+                run_states_changed.notify_all()
+
+    def invalidate_config_response() -> None:
+        """配置、Token统计或更新检查结果变化后丢弃缓存的 /api/config 响应（调用方需持有 config_lock）。"""
+        config_response_cache.clear()
+
+    def start_update_check(force: bool = False) -> None:
+        if not _as_bool(config_manager.get("AutoUpdateCheck", True), True):
+            return
+
+        with update_lock:
+            already_checked = update_state["checked"]
+
+        if already_checked and not force:
+            return
+
+        def _worker() -> None:
+            latest = check_for_updates(CURRENT_VERSION)
+            timestamp = _now_iso()
+            with update_lock:
+                update_state["latest"] = latest
+                update_state["checked"] = timestamp
+            with config_lock:
+                invalidate_config_response()
+
+        threading.Thread(target=_worker, daemon=True).start()
+
+    def _execute_run(
+        run_id: str,
+        saved_files: List[Dict[str, Any]],
+        topic: str,
+        run_dir: Path,
+        max_workers: int,
+        save_markdown: bool,
+        render_html: bool,
+    ) -> None:
+        aggregate = {"vlm_in": 0, "vlm_out": 0, "llm_in": 0, "llm_out": 0}
+        failures = 0
+        # 模型调用失败通常整批同因（如密钥错误），只保留首个完整堆栈，结束时输出一次
+        first_traceback: List[str] = []
+
+        update_run_state(run_id, lambda state: {"status": "running"})
+
+        # 同一批次中内容相同的图片只调用一次模型：摘要 -> (模型调用任务, 首个文件名)，仅在事件循环线程中访问
+        model_calls: Dict[str, Tuple["asyncio.Future[Any]", str]] = {}
+
+        def finalize_single(
+            file_info: Dict[str, Any],
+            outcome: Optional[Tuple[str, Dict[str, int], Dict[str, int], Optional[str]]],
+            error: Optional[str],
+            reused_from: Optional[str] = None,
+        ) -> Dict[str, Any]:
+            """模型调用结束后的落盘与统计工作，在线程池中执行，不占用事件循环。"""
+            saved_path: Path = file_info["path"]
+            logs: List[str] = [f"开始处理: {file_info['original']}"]
+            if reused_from:
+                logs.append(f"与 {reused_from} 内容相同，复用其批改结果")
+            markdown_rel: Optional[str] = None
+            html_rel: Optional[str] = None
+            vlm_usage = {"prompt_tokens": 0, "completion_tokens": 0}
+            llm_usage = {"prompt_tokens": 0, "completion_tokens": 0}
+            rendered_html_path: Optional[str] = None
+
+            report_markdown_path: Path = file_info["report_markdown"]
+
+            try:
+                if outcome is None:
+                    raise RuntimeError(error or "未知错误")
+                final_report, raw_vlm_usage, raw_llm_usage, rendered_html_path = outcome
+
+                vlm_usage = _usage_snapshot(raw_vlm_usage)
+                llm_usage = _usage_snapshot(raw_llm_usage)
+
+                # Markdown 只在需要保存时写入；HTML 由内存中的报告直接渲染，无需先落盘再删除
+                if save_markdown:
+                    _write_text_file(report_markdown_path, final_report)
+                    markdown_rel = file_info["markdown_rel"]
+                    logs.append(f"已生成 Markdown: {file_info['markdown_name']}")
+
+                if rendered_html_path:
+                    html_path = run_dir / file_info["html_name"]
+                    if Path(rendered_html_path) != html_path:
+                        # 复用的结果只渲染过首个文件的 HTML，复制一份到本文件名下
+                        shutil.copyfile(rendered_html_path, html_path)
+                    html_rel = file_info["html_rel"]
+                    logs.append(f"已生成 HTML: {file_info['html_name']}")
+
+            except Exception as exc:  # pylint: disable=broad-except
+                if outcome is not None:
+                    logger.exception("文件处理失败: %s", saved_path)
+                error = str(exc)
+                logs.append(f"处理失败: {error}")
+
+            return {
+                "index": file_info["index"],
+                "original": file_info["original"],
+                "saved": file_info["saved_rel"],
+                "markdown": markdown_rel,
+                "html": html_rel,
+                "vlm_usage": vlm_usage,
+                "llm_usage": llm_usage,
+                "logs": logs,
+                "error": error,
+            }
+
+        def publish_report_text(file_info: Dict[str, Any], text: str) -> None:
+            # 生成中的报告文本按文件序号放入 streaming，供页面逐步显示；该文件完成时移除
+            key = str(file_info["index"])
+            update_run_state(
+                run_id,
+                lambda state: {
+                    "streaming": {
+                        **state["streaming"],
+                        key: {"original": file_info["original"], "text": text},
+                    }
+                },
+            )
+
+        async def call_model(file_info: Dict[str, Any]) -> Tuple[Any, Optional[str]]:
+            # 网络调用以协程形式在 ApiService 的常驻事件循环中并发执行，由信号量限制并发数
+            async with semaphore:
+                try:
+                    outcome = await api_service.process_essay_image_async(
+                        str(file_info["path"]),
+                        topic,
+                        render_html=render_html,
+                        on_report_text=partial(publish_report_text, file_info),
+                    )
+                    return outcome, None
+                except Exception as exc:  # pylint: disable=broad-except
+                    logger.warning("文件处理失败: %s: %s", file_info["path"], exc)
+                    if not first_traceback:
+                        first_traceback.append(traceback.format_exc())
+                    return None, str(exc)
+
+        async def process_single(file_info: Dict[str, Any]) -> Dict[str, Any]:
+            reused_from: Optional[str] = None
+            shared = model_calls.get(file_info["digest"])
+            if shared is None:
+                task = asyncio.ensure_future(call_model(file_info))
+                model_calls[file_info["digest"]] = (task, file_info["original"])
+            else:
+                task, reused_from = shared
+            outcome, error = await task
+            if reused_from and outcome is not None:
+                # 复用结果不重复计入 Token 用量
+                final_report, _, _, rendered_html_path = outcome
+                outcome = (final_report, None, None, rendered_html_path)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                postprocess_pool, finalize_single, file_info, outcome, error, reused_from
+            )
+
+        def record_result(
+            result: Dict[str, Any], totals: Dict[str, int], state: Dict[str, Any]
+        ) -> Dict[str, Any]:
+            # 结果列表按文件序号保持有序，轮询时无需再排序；
+            # seq 取完成计数，单调递增，供 ?since= 只返回客户端尚未收到的结果
+            completed = state["completed"] + 1
+            changes = {
+                "completed": completed,
+                "results": sorted(
+                    (*state["results"], {**result, "seq": completed}),
+                    key=lambda item: item["index"],
+                ),
+                "aggregate": totals,
+            }
+            key = str(result["index"])
+            if key in state["streaming"]:
+                changes["streaming"] = {k: v for k, v in state["streaming"].items() if k != key}
+            if result["error"]:
+                changes["errors"] = [
+                    *state["errors"],
+                    {"index": result["index"], "message": result["error"]},
+                ]
+            return changes
+
+        try:
+            # 信号量须在协程所在的 ApiService 事件循环中创建：Python 3.9 在无事件循环的线程中构造会报错
+            semaphore = api_service.run_async(_make_semaphore(max_workers)).result()
+            futures = [api_service.run_async(process_single(info)) for info in saved_files]
+            for future in as_completed(futures):
+                result = future.result()
+                if not result["error"]:
+                    aggregate["vlm_in"] += result["vlm_usage"]["prompt_tokens"]
+                    aggregate["vlm_out"] += result["vlm_usage"]["completion_tokens"]
+                    aggregate["llm_in"] += result["llm_usage"]["prompt_tokens"]
+                    aggregate["llm_out"] += result["llm_usage"]["completion_tokens"]
+                else:
+                    failures += 1
+
+                update_run_state(run_id, partial(record_result, result, aggregate.copy()))
+        except Exception as exc:  # pylint: disable=broad-except
+            logging.exception("批处理任务失败: %s", run_id)
+            # 变更函数只捕获普通局部变量：except 结束后 exc 会被解除绑定
+            error_message = str(exc)
+            totals = aggregate.copy()
+            update_run_state(
+                run_id,
+                lambda state: {
+                    "status": "failed",
+                    "error": error_message,
+                    "aggregate": totals,
+                    "streaming": {},
+                    "finished_at": _now_iso(),
+                },
+            )
+            return
+        finally:
+            # 各文件的 Token 用量已汇总在 aggregate 中，整批结束后一次性计入配置并保存
+            if any(aggregate.values()):
+                with config_lock:
+                    config_manager.update_token_usage(
+                        aggregate["vlm_in"],
+                        aggregate["vlm_out"],
+                        aggregate["llm_in"],
+                        aggregate["llm_out"],
+                    )
+                    config_manager.save()
+                    invalidate_config_response()
+
+        if first_traceback:
+            logger.error(
+                "任务 %s 中有 %d 个文件处理失败，首个错误的堆栈：\n%s",
+                run_id,
+                failures,
+                first_traceback[0].rstrip(),
+            )
+
+        total = len(saved_files)
+        if total == 0:
+            status = "empty"
+        elif failures == 0:
+            status = "ok"
+        elif failures == total:
+            status = "failed"
+        else:
+            status = "partial"
+
+        update_run_state(
+            run_id,
+            lambda state: {
+                "status": status,
+                "aggregate": aggregate.copy(),
+                "completed": total,
+                "finished_at": _now_iso(),
+            },
+        )
+
+    def build_config_payload(include_prompt: bool) -> Dict[str, Any]:
+        usage = {
+            "vlm_input": int(config_manager.get("UsageVlmInput", 0) or 0),
+            "vlm_output": int(config_manager.get("UsageVlmOutput", 0) or 0),
+            "llm_input": int(config_manager.get("UsageLlmInput", 0) or 0),
+            "llm_output": int(config_manager.get("UsageLlmOutput", 0) or 0),
+        }
+
+        with update_lock:
+            latest_version = update_state["latest"]
+            checked_at = update_state["checked"]
+
+        has_vlm_key = bool(config_manager.get("VlmApiKey"))
+        has_llm_key = bool(config_manager.get("LlmApiKey"))
+
+        data = {
+            "VlmUrl": config_manager.get("VlmUrl", ""),
+            "VlmApiKey": "",
+            "HasVlmApiKey": has_vlm_key,
+            "VlmModel": config_manager.get("VlmModel", ""),
+            "VlmTemperature": config_manager.get("VlmTemperature", 0.0),
+            "LlmUrl": config_manager.get("LlmUrl", ""),
+            "LlmApiKey": "",
+            "HasLlmApiKey": has_llm_key,
+            "LlmModel": config_manager.get("LlmModel", ""),
+            "LlmTemperature": config_manager.get("LlmTemperature", 0.0),
+            "SensitivityFactor": config_manager.get("SensitivityFactor", "1.0"),
+            "MaxWorkers": config_manager.get("MaxWorkers", 4),
+            "MaxRetries": config_manager.get("MaxRetries", 3),
+            "RetryDelay": config_manager.get("RetryDelay", 5),
+            "RequestTimeout": config_manager.get("RequestTimeout", 120),
+            "SaveMarkdown": _as_bool(config_manager.get("SaveMarkdown", True), True),
+            "RenderMarkdown": _as_bool(config_manager.get("RenderMarkdown", True), True),
+            "AutoUpdateCheck": _as_bool(config_manager.get("AutoUpdateCheck", True), True),
+            "OutputDirectory": str(config_manager.get("OutputDirectory", DEFAULT_OUTPUT_DIR_NAME)),
+            "Usage": usage,
+            "CurrentVersion": CURRENT_VERSION,
+            "LatestVersion": latest_version,
+            "CheckedAt": checked_at,
+        }
+        if include_prompt:
+            data["LlmPromptTemplate"] = config_manager.get("LlmPromptTemplate") or DEFAULT_LLM_PROMPT_TEMPLATE
+        return data
+
+    @app.get("/api/config")
+    def read_config():
+        # 页面轮询配置时传 prompt=0 省去体积较大的模板，模板改由 /api/prompt-template 按需获取
+        include_prompt = request.args.get("prompt") != "0"
+        with config_lock:
+            body = config_response_cache.get(include_prompt)
+            if body is None:
+                body = app.json.dumps(build_config_payload(include_prompt))
+                config_response_cache[include_prompt] = body
+        return app.response_class(body, mimetype=app.json.mimetype)
+
+    @app.get("/api/prompt-template")
+    def get_prompt_template():
+        return jsonify(
+            {
+                "LlmPromptTemplate": config_manager.get("LlmPromptTemplate") or DEFAULT_LLM_PROMPT_TEMPLATE,
+                "DefaultTemplate": DEFAULT_LLM_PROMPT_TEMPLATE,
+            }
+        )
+
+    @app.post("/api/config")
+    def update_config():
+        payload = request.get_json(silent=True) or {}
+
+        string_fields = [
+            "VlmUrl",
+            "VlmModel",
+            "LlmUrl",
+            "LlmModel",
+            "OutputDirectory",
+        ]
+        sensitive_fields = [
+            "VlmApiKey",
+            "LlmApiKey",
+        ]
+        int_fields = ["MaxWorkers", "MaxRetries", "RetryDelay"]
+        float_fields = {
+            "RequestTimeout": (1.0, None),
+            "VlmTemperature": (0.0, 2.0),
+            "LlmTemperature": (0.0, 2.0),
+        }
+        bool_fields = ["SaveMarkdown", "RenderMarkdown", "AutoUpdateCheck"]
+
+        updates: Dict[str, Any] = {}
+
+        for key in string_fields:
+            if key in payload:
+                value = (payload.get(key) or "").strip()
+                if key == "OutputDirectory" and not value:
+                    return jsonify({"error": "输出目录不能为空"}), 400
+                updates[key] = value
+
+        for key in sensitive_fields:
+            if key in payload:
+                value = (payload.get(key) or "").strip()
+                if value:
+                    updates[key] = value
+
+        # 值为 None 表示删除该配置项
+        if payload.get("ClearVlmApiKey"):
+            updates["VlmApiKey"] = None
+        if payload.get("ClearLlmApiKey"):
+            updates["LlmApiKey"] = None
+
+        for key in int_fields:
+            if key in payload and payload[key] not in (None, ""):
+                try:
+                    updates[key] = int(payload[key])
+                except (TypeError, ValueError):
+                    return jsonify({"error": f"{key} 需要是整数"}), 400
+
+        for key, bounds in float_fields.items():
+            if key in payload and payload[key] not in (None, ""):
+                try:
+                    value = float(payload[key])
+                except (TypeError, ValueError):
+                    return jsonify({"error": f"{key} 需要是数字"}), 400
+                min_val, max_val = bounds
+                if min_val is not None and value < min_val:
+                    return jsonify({"error": f"{key} 不能小于 {min_val}"}), 400
+                if max_val is not None and value > max_val:
+                    return jsonify({"error": f"{key} 不能大于 {max_val}"}), 400
+                updates[key] = value
+
+        if "SensitivityFactor" in payload and payload["SensitivityFactor"] not in (None, ""):
+            try:
+                updates["SensitivityFactor"] = float(payload["SensitivityFactor"])
+            except (TypeError, ValueError):
+                return jsonify({"error": "SensitivityFactor 需要是数字"}), 400
+
+        for key in bool_fields:
+            if key in payload:
+                updates[key] = bool(payload[key])
+
+        prompt_template = payload.get("LlmPromptTemplate")
+        if prompt_template is not None:
+            normalized = str(prompt_template).strip()
+            if not normalized:
+                updates["LlmPromptTemplate"] = None
+            elif normalized == DEFAULT_TEMPLATE_NORMALIZED:
+                updates["LlmPromptTemplate"] = None
+            else:
+                updates["LlmPromptTemplate"] = normalized
+
+        with config_lock:
+            template_changed = (
+                "LlmPromptTemplate" in updates
+                and updates["LlmPromptTemplate"] != config_manager.get("LlmPromptTemplate")
+            )
+            # 全部修改应用到内存后只保存一次；设置未发生变化时不重写配置文件
+            if config_manager.update_many(updates):
+                config_manager.save()
+                invalidate_config_response()
+            if "MaxWorkers" in updates:
+                worker_settings["max_workers"] = _parse_max_workers(updates["MaxWorkers"])
+            if "RenderMarkdown" in updates:
+                api_service.markdown_renderer.refresh()
+
+        if "OutputDirectory" in updates and updates["OutputDirectory"]:
+            output_root_cache.clear()
+            get_output_root()
+
+        if template_changed:
+            api_service.cache_invalidate()
+
+        start_update_check(force=True)
+        return jsonify({"status": "ok"})
+
+    @app.post("/api/process")
+    def process_files():
+        topic = (request.form.get("topic") or "").strip()
+        if not topic:
+            return jsonify({"error": "请输入作文题目"}), 400
+
+        uploads = request.files.getlist("files")
+        if not uploads:
+            return jsonify({"error": "请至少选择一张图片"}), 400
+
+        # 在保存上传文件、创建任务之前一次性校验必填配置，避免每个文件各自失败
+        fused = _as_bool(config_manager.get("FusedMode", False), False)
+        settings_ok, missing = config_manager.check_settings(fused=fused)
+        if not settings_ok:
+            return jsonify({"error": f"请先在「服务设置」中填写{missing}", "missing": missing}), 400
+
+        output_root = get_output_root()
+        run_id, run_dir = _create_run_directory(output_root)
+        # 任务目录直接位于输出根目录下，相对路径即 run id，无需再解析文件系统路径
+        run_path = run_id
+
+        saved_files: List[Dict[str, Any]] = []
+        used_names = set()
+        # 记录每个重名文件下一个可用的序号，同名图片很多时也无需从 1 开始逐个探测
+        next_counter: Dict[str, int] = {}
+        for index, upload in enumerate(uploads):
+            original_name = upload.filename or f"upload_{index + 1}.png"
+            safe_name = secure_filename(original_name) or f"upload_{index + 1}.png"
+            if safe_name in used_names:
+                stem = Path(safe_name).stem
+                suffix = Path(safe_name).suffix or ".png"
+                counter = next_counter.get(safe_name, 1)
+                candidate = f"{stem}_{counter}{suffix}"
+                while candidate in used_names:
+                    counter += 1
+                    candidate = f"{stem}_{counter}{suffix}"
+                next_counter[safe_name] = counter + 1
+                safe_name = candidate
+            used_names.add(safe_name)
+
+            saved_path = run_dir / safe_name
+            # 边写入边计算内容摘要，批次内重复的图片据此只调用一次模型
+            digest = hashlib.blake2b(digest_size=16)
+            with open(saved_path, "wb") as saved_file:
+                for chunk in iter(partial(upload.stream.read, UPLOAD_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    saved_file.write(chunk)
+            # 报告路径、文件名及相对输出目录的链接在提交时一次算好，工作线程直接使用
+            stem = saved_path.stem
+            markdown_name = f"{stem}_report.md"
+            html_name = f"{stem}_report.html"
+            saved_files.append(
+                {
+                    "index": index,
+                    "original": original_name,
+                    "name": safe_name,
+                    "path": saved_path,
+                    "digest": digest.hexdigest(),
+                    "report_markdown": run_dir / markdown_name,
+                    "markdown_name": markdown_name,
+                    "html_name": html_name,
+                    "saved_rel": f"{run_path}/{safe_name}",
+                    "markdown_rel": f"{run_path}/{markdown_name}",
+                    "html_rel": f"{run_path}/{html_name}",
+                }
+            )
+
+        max_workers = worker_settings["max_workers"]
+
+        # 输出选项在提交时取一次快照，任务进行中修改设置不影响本批文件
+        save_markdown = _as_bool(config_manager.get("SaveMarkdown", True), True)
+        render_html = _as_bool(config_manager.get("RenderMarkdown", True), True)
+
+        run_state = {
+            "run_id": run_id,
+            "status": "queued",
+            "total": len(saved_files),
+            "completed": 0,
+            "aggregate": {"vlm_in": 0, "vlm_out": 0, "llm_in": 0, "llm_out": 0},
+            "results": [],
+            "errors": [],
+            "streaming": {},
+            "revision": 0,
+            "run_path": run_path,
+            "created_at": _now_iso(),
+        }
+
+        with run_states_lock:
+            run_states[run_id] = run_state
+            if len(run_states) > MAX_RETAINED_RUNS:
+                # 字典按插入顺序即任务创建顺序；仍在进行中的任务不丢弃
+                finished = [
+                    key
+                    for key, value in run_states.items()
+                    if value.get("status") not in ("queued", "running")
+                ]
+                for key in finished[: len(run_states) - MAX_RETAINED_RUNS]:
+                    del run_states[key]
+
+        worker = threading.Thread(
+            target=_execute_run,
+            args=(run_id, saved_files, topic, run_dir, max_workers, save_markdown, render_html),
+            daemon=True,
+        )
+        worker.start()
+
+        return jsonify(
+            {
+                "status": "queued",
+                "run_id": run_id,
+                "total": len(saved_files),
+                "run_path": run_path,
+            }
+        )
+
+    @app.get("/api/run-status/<run_id>")
+    def run_status(run_id: str):
+        # 快照发布后不再修改，单次字典读取即可，无需与写入方争用锁
+        state = run_states.get(run_id)
+        if not state:
+            abort(404)
+        since = request.args.get("since", default=0, type=int)
+        response = jsonify(_run_status_payload(run_id, state, since))
+        # 状态未发布新快照时内容相同，允许以 304 应答条件请求
+        response.set_etag(f"{run_id}:{state['revision']}:{since}")
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    @app.get("/api/run-stream/<run_id>")
+    def run_stream(run_id: str):
+        """以 Server-Sent Events 推送任务状态：仅在发布新快照时发送，任务结束后关闭连接。"""
+        if run_id not in run_states:
+            abort(404)
+
+        def generate():
+            sent = None
+            while True:
+                with run_states_changed:
+                    run_states_changed.wait_for(
+                        lambda: run_states.get(run_id) is not sent, timeout=RUN_STREAM_KEEPALIVE
+                    )
+                    state = run_states.get(run_id)
+                if state is None:
+                    return
+                if state is sent:
+                    # 长时间无变化时发送注释行保活，避免连接被中间代理或浏览器断开
+                    yield ": keep-alive\n\n"
+                    continue
+                since = sent["completed"] if sent is not None else 0
+                sent = state
+                payload = _run_status_payload(run_id, state, since)
+                yield f"data: {app.json.dumps(payload)}\n\n"
+                if state.get("status") not in ("queued", "running"):
+                    return
+
+        return app.response_class(
+            generate(),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.get("/outputs/<path:requested_path>")
+    def serve_outputs(requested_path: str):
+        # send_from_directory 以 safe_join 拒绝越出输出目录的路径（纯字符串检查），
+        # 并以一次 isfile 判断对不存在的文件或目录返回 404，无需再逐级 resolve。
+        # 每次任务写入独立的 run 目录，生成后的文件不再改动，允许浏览器缓存一小时；
+        # 条件请求（ETag/Last-Modified）与 Range 由 send_from_directory 默认处理
+        return send_from_directory(
+            str(get_output_root()), requested_path, max_age=OUTPUT_CACHE_MAX_AGE
+        )
+
+    @app.get("/api/update-status")
+    def update_status():
+        with update_lock:
+            return jsonify(
+                {
+                    "current": CURRENT_VERSION,
+                    "latest": update_state["latest"],
+                    "checked": update_state["checked"],
+                }
+            )
+
+    @app.post("/api/update-check")
+    def trigger_update_check():
+        start_update_check(force=True)
+        return jsonify({"status": "checking"})
+
+    def precompress(body: bytes) -> Tuple[bytes, bytes, str]:
+        """返回原始内容、预先gzip压缩的内容及 ETag，供按 Accept-Encoding 协商时直接复用。"""
+        return body, gzip.compress(body, compresslevel=9, mtime=0), hashlib.sha1(body).hexdigest()
+
+    def negotiated_response(cached: Tuple[bytes, bytes, str], mimetype: str):
+        body, compressed, etag = cached
+        if "gzip" in request.accept_encodings:
+            response = app.response_class(compressed, mimetype=mimetype)
+            response.content_encoding = "gzip"
+            # 压缩与未压缩的表示需使用不同的 ETag
+            response.set_etag(f"{etag}-gz")
+        else:
+            response = app.response_class(body, mimetype=mimetype)
+            response.set_etag(etag)
+        response.vary.add("Accept-Encoding")
+        return response
+
+    def get_static_assets() -> Dict[str, Tuple[Tuple[bytes, bytes, str], str]]:
+        """渲染页面样式与脚本，以内容哈希命名并预先压缩，首次使用时构建一次。"""
+        assets = index_cache.get("assets")
+        if assets is None:
+            assets = {}
+            for source, suffix, mimetype in (
+                (INDEX_STYLE, "css", "text/css"),
+                (
+                    render_template_string(INDEX_SCRIPT, default_output_dir=DEFAULT_OUTPUT_DIR_NAME),
+                    "js",
+                    "text/javascript",
+                ),
+            ):
+                body = source.encode("utf-8")
+                name = f"app.{hashlib.blake2b(body, digest_size=8).hexdigest()}.{suffix}"
+                assets[name] = (precompress(body), mimetype)
+            index_cache["assets"] = assets
+        return assets
+
+    @app.get("/assets/<name>")
+    def static_asset(name: str):
+        asset = get_static_assets().get(name)
+        if asset is None:
+            abort(404)
+        response = negotiated_response(*asset)
+        response.cache_control.max_age = ASSET_CACHE_MAX_AGE
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response.make_conditional(request)
+
+    @app.get("/")
+    def index():
+        cached = index_cache.get("page")
+        if cached is None:
+            # 页面只依赖版本号等常量，首次请求时渲染一次，编码并预先gzip压缩后连同 ETag 一起复用
+            asset_urls = {
+                name.rsplit(".", 1)[1]: url_for("static_asset", name=name)
+                for name in get_static_assets()
+            }
+            html = render_template_string(
+                INDEX_TEMPLATE,
+                current_version=CURRENT_VERSION,
+                config_url=INDEX_CONFIG_URL,
+                style_url=asset_urls["css"],
+                script_url=asset_urls["js"],
+            ).encode("utf-8")
+            cached = precompress(html)
+            index_cache["page"] = cached
+        response = negotiated_response(cached, "text/html")
+        # 浏览器收到响应头即可开始获取配置，不必等解析到 <head> 中的 preload
+        response.headers["Link"] = f"<{INDEX_CONFIG_URL}>; rel=preload; as=fetch; crossorigin"
+        # 每次都向服务器确认（no-cache），内容未变时返回 304，升级版本后也不会用到旧页面
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
 
     start_update_check()
     return app